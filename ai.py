@@ -0,0 +1,196 @@
+"""
+The bot's side of a duel: card choices by expectimax search over engine.py.
+
+The rules have no chance in them, so the chance nodes model the opponent: with
+probability `opponent_skill` they answer with their best card, otherwise with any
+of their cards. Against a perfect opponent (skill 1) this is plain minimax; below
+it the bot prefers lines that leave a weaker player more ways to go wrong.
+
+Searches deepen one ply at a time until the time budget runs out, keeping the
+choice of the deepest search that finished. Positions are cached in an LRU
+transposition table keyed by the card stats, not their names or identifiers, so
+entries are shared between duels. Everything here is plain functions on immutable
+states, so it can run in a thread or a worker process.
+"""
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from card_catalog import CardInstance
+import engine
+
+opponent_skill = 0.8
+transposition_limit = 200000
+# plies searched at most; a duel between cards with no attack never ends on its own
+max_depth = 60
+# templates a deck is chosen from, strongest first: C(12, 3) = 220 decks to search
+deck_pool = 12
+
+
+class OutOfTime(Exception):
+    pass
+
+
+class TranspositionTable:
+    """
+    Position key -> (searched depth, value), dropping the least recently used past `limit`.
+    """
+
+    def __init__(self, limit=transposition_limit):
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # searches for several duels may share the table from different threads
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, depth, value):
+        with self._lock:
+            self._entries[key] = (depth, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.limit:
+                self._entries.popitem(last=False)
+
+
+transpositions = TranspositionTable()
+
+
+def state_key(state, seat, skill):
+    """
+    A flat tuple of ints for a running game: whose view, whose move, the attacking
+    card's position, then each side's card count and (attack, health) pairs.
+    """
+    key = [seat, state.attacker, -1, int(skill * 1000)]
+    for position, card in enumerate(state.limbos[state.attacker]):
+        if card.identifier == state.attacking_card:
+            key[2] = position
+    for limbo in state.limbos:
+        key.append(len(limbo))
+        for card in limbo:
+            key.append(card.attack)
+            key.append(card.health)
+    return tuple(key)
+
+
+def evaluate(state, seat):
+    """
+    Value of a position for `seat` from -1 (lost) to 1 (won), guessed from the
+    attack times health left on each side when the search stops before the end.
+    """
+    if state.phase == engine.OVER:
+        if state.winner == engine.DRAW:
+            return 0.0
+        return 1.0 if state.winner == seat else -1.0
+    mine = sum(card.attack * card.health for card in state.limbos[seat])
+    theirs = sum(card.attack * card.health for card in state.limbos[1 - seat])
+    if mine + theirs == 0:
+        return 0.0
+    # a guess is never worth as much as a result
+    return 0.9 * (mine - theirs) / (mine + theirs)
+
+
+class Search:
+    def __init__(self, seat, deadline, skill=opponent_skill, table=transpositions):
+        self.seat = seat
+        self.deadline = deadline
+        self.skill = skill
+        self.table = table
+        self.nodes = 0
+
+    def value(self, state, depth):
+        """
+        (value for our seat, whether it is exact) of `state`, searched `depth` plies deep.
+        """
+        if state.phase == engine.OVER or depth == 0:
+            return evaluate(state, self.seat), state.phase == engine.OVER
+
+        self.nodes += 1
+        if self.nodes & 63 == 0 and time.perf_counter() > self.deadline:
+            raise OutOfTime()
+
+        key = state_key(state, self.seat, self.skill)
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= depth:
+            return entry[1], entry[0] == math.inf
+
+        values = []
+        exact = True
+        for action in engine.legal_actions(state):
+            value, child_exact = self.value(engine.apply_action(state, action)[0], depth - 1)
+            values.append(value)
+            exact = exact and child_exact
+
+        if engine.to_move(state) == self.seat:
+            value = max(values)
+        else:
+            value = self.skill * min(values) + (1 - self.skill) * sum(values) / len(values)
+        self.table.put(key, math.inf if exact else depth, value)
+        return value, exact
+
+
+def _deepen(search, candidates):
+    """
+    Iterative deepening over (choice, state) candidates. Returns the best choice of
+    the deepest search that finished in time.
+    """
+    best = candidates[0][0]
+    try:
+        for depth in range(max_depth):
+            results = []
+            for choice, state in candidates:
+                # a shallow pass over many candidates finds no node to check the time at
+                if time.perf_counter() > search.deadline:
+                    raise OutOfTime()
+                results.append((search.value(state, depth), choice))
+            best = max(results, key=lambda result: result[0][0])[1]
+            if all(exact for (_, exact), _ in results):
+                break
+    except OutOfTime:
+        pass
+    return best
+
+
+def choose_card(state, seat, budget, skill=opponent_skill):
+    """
+    Identifier of the card `seat` should attack or defend with, found within `budget` seconds.
+    """
+    actions = engine.legal_actions(state)
+    if len(actions) == 1:
+        return actions[0].card
+    search = Search(seat, time.perf_counter() + budget, skill)
+    return _deepen(search, [(action.card, engine.apply_action(state, action)[0]) for action in actions])
+
+
+def choose_deck(templates, opponent_deck, seat, budget, size=3, skill=opponent_skill):
+    """
+    Names of the `size` templates to summon against `opponent_deck`, found within
+    `budget` seconds. Without an opponent deck yet, the cards with the most attack
+    times health are taken; with one, decks of the `deck_pool` strongest are searched.
+    """
+    ranked = sorted(templates, key=lambda template: template.attack * template.health, reverse=True)
+    if not opponent_deck:
+        return [template.name for template in ranked[:size]]
+
+    candidates = []
+    for deck in itertools.combinations(ranked[:max(size, deck_pool)], size):
+        cards = [CardInstance(seat * size + i, template.name, template.attack, template.health)
+                 for i, template in enumerate(deck)]
+        decks = (opponent_deck, cards) if seat == 1 else (cards, opponent_deck)
+        candidates.append((tuple(template.name for template in deck), engine.new_game(*decks)))
+    search = Search(seat, time.perf_counter() + budget, skill)
+    return list(_deepen(search, candidates))
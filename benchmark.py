@@ -0,0 +1,236 @@
+"""
+Offline benchmark of full duels.
+
+Runs complete !duel flows (summoning, battle, game over, ratings) through the real
+command code, with fake_discord standing in for the gateway and REST API and scripted
+players answering every prompt. Reports throughput, turn latency, API calls per duel
+and event-loop lag at several levels of concurrency.
+
+Usage: python benchmark.py [--duels 1 10 100 1000] [--api-latency S] [--think S] [--rate-limit]
+                           [--json PATH] [--baseline PATH] [--tolerance 0.2]
+
+With --baseline the run fails (exit status 1) if it is slower or makes more API calls
+than the saved results, so it can gate changes to the duel hot paths.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+from fake_discord import FakeAPI, FakeContext, FakeGuild, user_message
+
+prompt_pattern = re.compile(r"<@(\d+)>, choose a card")
+summon_title = "Summoning Phase for "
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class ScriptedPlayers:
+    """
+    Answers the bot's prompts for every fake member, like a player reading the duel room.
+    """
+
+    def __init__(self, commands, think=0.0):
+        self.commands = commands
+        self.think = think
+        self.card_names = [card.name for card in commands.card_catalog]
+        self.members = {}
+        self.prompted = {}
+        self.summons = {}
+        self.answered_at = {}
+        self.turn_latencies = []
+
+    def add(self, member):
+        self.members[member.display_name] = member
+
+    def on_bot_message(self, message):
+        for match in prompt_pattern.finditer(message.content):
+            self.prompted[message.channel.id] = int(match.group(1))
+        for embed in message.embeds:
+            if embed.title and embed.title.startswith(summon_title):
+                member = self.members[embed.title[len(summon_title):]]
+                self.prompted[message.channel.id] = member.id
+                self.summons[member.id] = iter(random.sample(self.card_names, 3))
+
+    def on_wait(self, channel_id, author_ids):
+        answered_at = self.answered_at.pop(channel_id, None)
+        if answered_at is not None:
+            self.turn_latencies.append(time.perf_counter() - answered_at)
+
+        member_id = self.prompted.get(channel_id)
+        if member_id is None or member_id not in author_ids:
+            return
+        loop = asyncio.get_running_loop()
+        if self.think:
+            loop.call_later(self.think, self.answer, channel_id, member_id)
+        else:
+            loop.call_soon(self.answer, channel_id, member_id)
+
+    def answer(self, channel_id, member_id):
+        session = self.commands.get_session(channel_id)
+        if session is None:
+            return
+        member = session.player1 if session.player1.id == member_id else session.player2
+        if session.game is None:
+            content = next(self.summons[member_id], "done")
+        else:
+            content = random.choice(session.limbo(member)).name
+        self.answered_at[channel_id] = time.perf_counter()
+        self.commands.router.dispatch(user_message(session.channel, member, content))
+
+
+async def measure_loop_lag(samples, interval=0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_level(commands, duels, api_latency, think):
+    api = FakeAPI(api_latency)
+    players = ScriptedPlayers(commands, think)
+    api.listeners.append(players.on_bot_message)
+    commands.router.on_wait = players.on_wait
+
+    guilds = [FakeGuild(api, f"guild-{i}") for i in range(max(1, duels // 10))]
+    lobbies = {guild.id: guild.add_text_channel("general") for guild in guilds}
+    matches = []
+    for i in range(duels):
+        guild = guilds[i % len(guilds)]
+        player1 = guild.add_member(f"player-{i}-a")
+        player2 = guild.add_member(f"player-{i}-b")
+        players.add(player1)
+        players.add(player2)
+        matches.append((FakeContext(api, guild, lobbies[guild.id], player1), player2))
+
+    lag_samples = []
+    lag_task = asyncio.create_task(measure_loop_lag(lag_samples))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(commands.duel.callback(ctx, opponent) for ctx, opponent in matches),
+                                   return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    lag_task.cancel()
+    commands.router.on_wait = None
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors[:3]:
+        print(f"duel failed: {error!r}", file=sys.stderr)
+
+    return {
+        "duels": duels,
+        "errors": len(errors),
+        "seconds": elapsed,
+        "duels_per_second": duels / elapsed,
+        "turns": len(players.turn_latencies),
+        "turn_p50_ms": percentile(players.turn_latencies, 0.5) * 1000,
+        "turn_p99_ms": percentile(players.turn_latencies, 0.99) * 1000,
+        "api_calls_per_duel": api.total / duels,
+        "api_calls": dict(api.calls),
+        "loop_lag_p50_ms": percentile(lag_samples, 0.5) * 1000,
+        "loop_lag_p99_ms": percentile(lag_samples, 0.99) * 1000,
+        "loop_lag_max_ms": max(lag_samples, default=0.0) * 1000,
+    }
+
+
+def print_results(results):
+    print(f"{'duels':>6}{'errors':>8}{'duels/s':>10}{'turn p50':>10}{'turn p99':>10}{'calls/duel':>12}"
+          f"{'lag p50':>9}{'lag p99':>9}{'lag max':>9}")
+    for result in results:
+        print(f"{result['duels']:>6}{result['errors']:>8}{result['duels_per_second']:>10.1f}"
+              f"{result['turn_p50_ms']:>8.2f}ms{result['turn_p99_ms']:>8.2f}ms{result['api_calls_per_duel']:>12.1f}"
+              f"{result['loop_lag_p50_ms']:>7.2f}ms{result['loop_lag_p99_ms']:>7.2f}ms{result['loop_lag_max_ms']:>7.1f}ms")
+
+
+def compare(results, baseline, tolerance):
+    failures = []
+    previous = {result["duels"]: result for result in baseline}
+    for result in results:
+        before = previous.get(result["duels"])
+        if before is None:
+            continue
+        label = f"{result['duels']} duels"
+        if result["errors"] > before["errors"]:
+            failures.append(f"{label}: {result['errors']} failed duels (was {before['errors']})")
+        if result["duels_per_second"] < before["duels_per_second"] * (1 - tolerance):
+            failures.append(f"{label}: {result['duels_per_second']:.1f} duels/s (was {before['duels_per_second']:.1f})")
+        if result["turn_p99_ms"] > before["turn_p99_ms"] * (1 + tolerance):
+            failures.append(f"{label}: turn p99 {result['turn_p99_ms']:.2f}ms (was {before['turn_p99_ms']:.2f}ms)")
+        if result["api_calls_per_duel"] > before["api_calls_per_duel"] + 0.5:
+            failures.append(f"{label}: {result['api_calls_per_duel']:.1f} API calls per duel"
+                            f" (was {before['api_calls_per_duel']:.1f})")
+    return failures
+
+
+async def run(args):
+    import commands
+    import outbox
+
+    commands.load_data()
+    commands.room_close_delay = 0
+    if not args.rate_limit:
+        outbox.bucket_rate = 10 ** 9
+    random.seed(args.seed)
+
+    results = []
+    for duels in args.duels:
+        results.append(await run_level(commands, duels, args.api_latency, args.think))
+    commands.ratings.close()
+    commands.checkpoints.close()
+    commands.replay_store.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full duels against a fake Discord.")
+    parser.add_argument("--duels", type=int, nargs="+", default=[1, 10, 100, 1000],
+                        help="numbers of concurrent duels to run")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="seconds added to every fake API call")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds a player takes to answer")
+    parser.add_argument("--rate-limit", action="store_true", help="keep the outbox's per-channel rate limit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="write the results to a JSON file")
+    parser.add_argument("--baseline", metavar="PATH", help="fail if results are worse than this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    # the bot keeps cards.json and ratings.json in its working directory; keep the real ratings out of it
+    source = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, source)
+    with tempfile.TemporaryDirectory() as workdir:
+        shutil.copy(os.path.join(source, "cards.json"), workdir)
+        os.chdir(workdir)
+        results = asyncio.run(run(args))
+        os.chdir(source)
+
+    print_results(results)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        failures = compare(results, baseline, args.tolerance)
+        for failure in failures:
+            print(f"regression: {failure}")
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,37 @@
+import argparse
+import sys
+
+import commands
 from commands import bot
 from BotToken import BotToken
+from launcher import shutdown_exit_code
 
 
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user.name} - {bot.user.id}')
-    try:
-        synced = await bot.tree.sync()
-        print(f'synced {len(synced)} commands(s)')
-    except Exception as e:
-        print(e)
 
 
-bot.run(BotToken)
+def main():
+    parser = argparse.ArgumentParser(description="Run the bot, or one shard worker of it (see launcher.py).")
+    parser.add_argument("--sync", action="store_true", help="push the slash commands even if they look unchanged")
+    parser.add_argument("--worker", type=int, help="number of this shard worker")
+    parser.add_argument("--shards", help="shard ids this worker runs, e.g. 0,1,2")
+    parser.add_argument("--shard-count", type=int, help="shards in the whole bot")
+    args = parser.parse_args()
+
+    commands.force_command_sync = args.sync
+    if args.worker is not None:
+        if not args.shards or not args.shard_count:
+            parser.error("--worker needs --shards and --shard-count")
+        commands.configure_shard_worker(args.worker, [int(shard) for shard in args.shards.split(",")], args.shard_count)
+
+    bot.run(BotToken)
+    if commands.shutdown_requested:
+        # tells launcher.py not to restart this worker, and to stop the others
+        sys.exit(shutdown_exit_code)
+
+
+# the bot's search processes are spawned and import this module again
+if __name__ == "__main__":
+    main()
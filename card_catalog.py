@@ -0,0 +1,130 @@
+import asyncio
+import difflib
+import hashlib
+import json
+import os
+from typing import NamedTuple
+
+
+class CardTemplate(NamedTuple):
+    """
+    A card as defined in cards.json. Shared by every duel, never modified.
+    """
+    name: str
+    attack: int
+    health: int
+    ability: tuple
+
+    def instance(self, identifier):
+        return CardInstance(identifier, self.name, self.attack, self.health)
+
+
+class CardInstance(NamedTuple):
+    """
+    A summoned card in one duel. Damage produces a new instance with `_replace`.
+    """
+    identifier: int
+    name: str
+    attack: int
+    health: int
+
+
+class _TrieNode:
+    __slots__ = ("children", "templates")
+
+    def __init__(self):
+        self.children = {}
+        self.templates = []
+
+
+class CardCatalog:
+    """
+    Card templates loaded from cards.json, indexed by casefolded name and by prefix.
+
+    `refresh` (or the `watch` task) reloads the file when it changes on disk; duels
+    already in progress keep the instances they summoned.
+    """
+
+    def __init__(self, path, load=True):
+        self.path = path
+        self.version = None
+        self.templates = ()
+        self._by_name = {}
+        self._trie = _TrieNode()
+        self._mtime = None
+        if load:
+            self.reload()
+
+    def reload(self):
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        mtime = os.stat(self.path).st_mtime_ns
+
+        templates = tuple(CardTemplate(card["name"], card["attack"], card["health"], tuple(card["ability"]))
+                          for card in json.loads(raw))
+        by_name = {template.name.casefold(): template for template in templates}
+        trie = _TrieNode()
+        for key, template in by_name.items():
+            node = trie
+            node.templates.append(template)
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+                node.templates.append(template)
+
+        # swap everything at once so lookups never see a half-built index
+        self.templates, self._by_name, self._trie = templates, by_name, trie
+        self.version = hashlib.sha1(raw).hexdigest()[:12]
+        self._mtime = mtime
+
+    def refresh(self):
+        """
+        Reload if cards.json changed since the last load. Returns True if it did.
+        """
+        if os.stat(self.path).st_mtime_ns == self._mtime:
+            return False
+        self.reload()
+        return True
+
+    async def watch(self, interval=5.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if self.refresh():
+                    print(f"reloaded {len(self)} cards from {self.path}")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                # keep the previous catalog until the file is valid again
+                print(f"could not reload {self.path}: {e}")
+
+    def get(self, name):
+        return self._by_name.get(name.strip().casefold())
+
+    def complete(self, prefix, limit=25):
+        node = self._trie
+        for char in prefix.strip().casefold():
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.templates[:limit]
+
+    def resolve(self, text):
+        """
+        The card named exactly `text`, or the only card whose name starts with it.
+        """
+        if not text.strip():
+            return None
+        template = self.get(text)
+        if template is None:
+            matches = self.complete(text, limit=2)
+            if len(matches) == 1:
+                template = matches[0]
+        return template
+
+    def suggest(self, text, limit=3):
+        return [self._by_name[key] for key in
+                difflib.get_close_matches(text.strip().casefold(), self._by_name, n=limit, cutoff=0.6)]
+
+    def __iter__(self):
+        return iter(self.templates)
+
+    def __len__(self):
+        return len(self.templates)
@@ -0,0 +1,152 @@
+import json
+import os
+
+from card_catalog import CardInstance
+import engine
+from metrics import metrics
+from writer import BatchWriter
+
+# bump when the snapshot layout changes; snapshots of other versions are ignored
+snapshot_version = 1
+
+
+def snapshot(session):
+    """
+    Everything needed to resume a duel, by id only: no Discord objects.
+    """
+    return {
+        "v": snapshot_version,
+        "guild": session.guild_id,
+        "channel": session.channel_id,
+        "players": [session.player1.id, session.player2.id],
+        "phase": session.phase,
+        # summoning progress; "ready" once a player has summoned their cards
+        "summon": [[state["phase"], [list(card) for card in state["limbo"]]]
+                   for state in (session.state(session.player1), session.state(session.player2))],
+        "game": encode_game(session.game),
+    }
+
+
+def encode_game(game):
+    if game is None:
+        return None
+    return [[[list(card) for card in limbo] for limbo in game.limbos],
+            game.attacker, game.phase, game.attacking_card, game.exchanges, game.winner]
+
+
+def restore_game(data):
+    if data is None:
+        return None
+    limbos, attacker, phase, attacking_card, exchanges, winner = data
+    limbos = tuple(tuple(CardInstance(*card) for card in limbo) for limbo in limbos)
+    return engine.GameState(limbos, attacker, phase, attacking_card, exchanges, winner)
+
+
+def restore_summon(data):
+    return [(phase, [CardInstance(*card) for card in limbo]) for phase, limbo in data]
+
+
+class CheckpointStore:
+    """
+    The newest snapshot of every duel in progress, in one append-only JSON lines file.
+
+    `save` and `remove` only queue the change; a background thread collects changes
+    for `interval` seconds, keeps just the newest one per duel and appends them in a
+    single write, so a busy duel costs one line per interval rather than one per turn.
+    A removal is a `[channel id, null]` line. Once the file holds `compact_every`
+    lines it is rewritten atomically with only the live snapshots.
+    """
+
+    def __init__(self, path, interval=0.5, compact_every=5000):
+        self.path = path
+        self.interval = interval
+        self.compact_every = compact_every
+        self._writer = BatchWriter("duel-checkpoints", self._append, start=self._open_journal,
+                                   finish=self._close_journal, delay=interval)
+        self._journal = None
+        # channel id -> newest snapshot line, as written by the thread
+        self._live = {}
+        self._lines = 0
+
+    def save(self, data):
+        # encoded here, since a string is cheap to hold while queued: the GC never scans it
+        self._put((data["channel"], json.dumps([data["channel"], data], separators=(",", ":")) + "\n"))
+
+    def remove(self, channel_id):
+        self._put((channel_id, None))
+
+    @metrics.timed("checkpoint_load_seconds")
+    def load(self):
+        """
+        The snapshots of the duels that were in progress, skipping other snapshot versions.
+        """
+        live = {}
+        lines = 0
+        try:
+            with open(self.path, "r") as f:
+                for line in f:
+                    try:
+                        channel_id, data = json.loads(line)
+                    except (ValueError, TypeError):
+                        # torn write from a crash, everything after it is lost anyway
+                        break
+                    lines += 1
+                    if data is None:
+                        live.pop(channel_id, None)
+                    else:
+                        live[channel_id] = (line if line.endswith("\n") else line + "\n", data)
+        except FileNotFoundError:
+            pass
+        self._live = {channel_id: line for channel_id, (line, _) in live.items()}
+        self._lines = lines
+        return [data for _, data in live.values() if data.get("v") == snapshot_version]
+
+    def _put(self, record):
+        self._writer.put(record)
+
+    # journal writer, run on the writer thread
+    def _open_journal(self):
+        self._journal = open(self.path, "a")
+
+    def _close_journal(self):
+        self._journal.close()
+
+    def _append(self, records):
+        latest = dict(records)
+        lines = []
+        for channel_id, line in latest.items():
+            if line is None:
+                # duels that ended before their first write need no line at all
+                if self._live.pop(channel_id, None) is None:
+                    continue
+                line = json.dumps([channel_id, None]) + "\n"
+            else:
+                self._live[channel_id] = line
+            lines.append(line)
+
+        if lines:
+            with metrics.timer("checkpoint_write_seconds"):
+                self._journal.writelines(lines)
+                self._journal.flush()
+            self._lines += len(lines)
+        if self._lines >= self.compact_every:
+            self._journal.close()
+            self._journal = self._compact()
+
+    @metrics.timed("checkpoint_compact_seconds")
+    def _compact(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.writelines(self._live.values())
+        os.replace(tmp_path, self.path)
+        self._lines = len(self._live)
+        return open(self.path, "a")
+
+    def flush(self, timeout=None):
+        """
+        Block until every queued change is on disk.
+        """
+        self._writer.flush(timeout)
+
+    def close(self):
+        self._writer.close()
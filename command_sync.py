@@ -0,0 +1,53 @@
+import hashlib
+import json
+import os
+
+import discord
+
+hash_file = ".command_tree_hash"
+
+
+def command_tree_fingerprint(tree, application_id=None):
+    """
+    Hash of everything Discord stores about the global slash commands: names,
+    descriptions, parameters, permissions.
+    """
+    payload = []
+    for command in tree.get_commands():
+        try:
+            payload.append(command.to_dict(tree))
+        except TypeError:
+            # discord.py before 2.4 takes no tree argument
+            payload.append(command.to_dict())
+    payload.sort(key=lambda command: (command.get("type", 1), command["name"]))
+    data = json.dumps({"application_id": application_id, "commands": payload}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+async def sync_command_tree(bot, force=False):
+    """
+    Sync the slash commands with Discord, unless they are unchanged since the last sync.
+    """
+    fingerprint = command_tree_fingerprint(bot.tree, bot.application_id)
+    try:
+        with open(hash_file, "r") as f:
+            synced_fingerprint = f.read().strip()
+    except FileNotFoundError:
+        synced_fingerprint = None
+
+    if not force and fingerprint == synced_fingerprint:
+        print("slash commands unchanged, skipping sync")
+        return None
+
+    try:
+        synced = await bot.tree.sync()
+    except discord.HTTPException as e:
+        print(f"could not sync slash commands: {e}")
+        return None
+
+    tmp_path = f"{hash_file}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(fingerprint)
+    os.replace(tmp_path, hash_file)
+    print(f'synced {len(synced)} commands(s)')
+    return synced
@@ -1,175 +1,577 @@
 import asyncio
-import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Literal, Union
 import discord
-import uuid
 from discord.ext import commands
+import ai
+import elo
+import engine
 from intents import intents
-
-with open("cards.json", "r") as file:
-    card_data = json.load(file)
-
-ratings = {}
+from card_catalog import CardCatalog
+from checkpoints import CheckpointStore, snapshot, restore_game, restore_summon
+from command_sync import sync_command_tree
+from embed_cache import EmbedCache
+from metrics import metrics, profiler, instrument_http, monitor_loop_lag, export_to_file, serve
+from outbox import ChannelOutbox, TokenBucket, totals as outbox_totals
+from replays import ReplayRecorder, ReplayStore
+from rooms import RoomPool
+from turn_ui import ComponentInput, TurnPanel, parse_custom_id, summon_view, turn_view
+from router import MessageRouter
+from scheduler import scheduler
+from leaderboard import RankIndex
+from match_history import MatchHistory, DRAW, FORFEIT
+from matchmaking import Matchmaker
+from tournament import Tournament, formats as tournament_formats
+from ratings_store import RatingsStore, SharedRatingsStore
+from duel_session import (duel_sessions, open_session, close_session, get_session, find_player_session,
+                          reserve_players, release_players, in_duel)
+
+# cards.json and ratings.json are loaded by load_data, not at import
+card_catalog = CardCatalog("cards.json", load=False)
+embed_cache = EmbedCache()
+router = MessageRouter()
+# "channel" leases pooled duel-room channels, "thread" opens a private thread per duel
+room_mode = "channel"
+room_pool = RoomPool(room_mode)
+# "components" shows turns as a select menu and buttons on one panel message, "text" as typed prompts;
+# typed answers work in both
+turn_input = "components"
+# seconds before an unanswered click is acknowledged without an update
+interaction_ack_delay = 2.5
+# seconds a finished duel's room stays open so players can read the result
+room_close_delay = 6
+forfeit_close_delay = 15
+background_tasks = []
+# duels started by the bot itself (matchmaking, resumed duels) rather than by a command
+duel_tasks = set()
+matchmaker = Matchmaker()
+# seconds between passes that match players whose rating windows have widened
+matchmaking_interval = 1.0
+# seconds the bot may think per move when it plays a duel itself (!duel bot); searches run in
+# the default thread pool, or with ai_processes > 0 in that many worker processes, which do not
+# compete with the event loop for the GIL and so get the longer ai_process_budget
+ai_move_budget = 0.2
+ai_processes = 0
+ai_process_budget = 1.0
+ai_pool = None
+# guild id -> the Tournament open for signups or running there
+tournaments = {}
+# duels of one tournament played at once; a duel makes about 25 API calls over a few minutes,
+# so this also caps the tournament's message rate
+tournament_concurrency = 16
+# rooms a tournament may open per `tournament_room_per` seconds
+tournament_room_rate = 4
+tournament_room_per = 10.0
+# seconds a round may take before its unfinished matches are decided without being played out
+tournament_round_time = 900
+# seconds between checks whether a paired player has finished a duel outside the tournament
+tournament_busy_poll = 5.0
+# one snapshot per duel in progress, so a restarted bot can resume them
+checkpoints = CheckpointStore("checkpoints.jsonl")
+# snapshots read by load_data, resumed once the bot is connected
+resumable_duels = []
 ratings_file = "ratings.json"
-active_players = {}
-duel_data = {}
-game_over = False
-game_phase = None
-print("bot started")
-
-bot = commands.Bot(command_prefix='!', intents=intents, application_id=1040675149348884530)
-
-
-def assign_card_ids(cards):
-    for card in cards:
-        card["id"] = f"{card['name']}_{hash(card)}"
-
-
-# initialize player ratings
-def save_ratings(ratings):
-    with open(ratings_file, "w") as f:
-        json.dump(ratings, f)
-
+ratings = RatingsStore(ratings_file, load=False)
+rank_index = RankIndex()
+# every finished duel, for rebuilding the ratings with recompute_ratings.py
+match_history = MatchHistory("matches.bin")
+# every finished duel's replay, for replay.py
+replay_store = ReplayStore("replays.jsonl")
+ratings.subscribe(rank_index.update)
+leaderboard_page_size = 10
+admin_user_id = 386162509943668758
+# Prometheus text export; set metrics_file to None to disable it, or metrics_port to serve it over HTTP
+metrics_file = "metrics.prom"
+metrics_port = None
+# set by bot.py --sync to push the slash commands even if they look unchanged
+force_command_sync = False
+# set by /shutdown, so bot.py exits in a way launcher.py does not restart
+shutdown_requested = False
+# False in every shard worker but the first, so only one process syncs the slash commands
+command_sync_enabled = True
+# seconds between reads of the rating changes other shard workers made
+ratings_poll_interval = 1.0
+
+# one process runs every shard Discord recommends, unless configure_shard_worker picks some
+bot = commands.AutoShardedBot(command_prefix='!', intents=intents, application_id=1040675149348884530)
+instrument_http(bot.http)
+metrics.gauge("active_duels", lambda: len(duel_sessions))
+metrics.gauge("pending_player_waits", lambda: router.pending)
+metrics.gauge("queued_players", lambda: len(matchmaker))
+metrics.gauge("pending_deadlines", lambda: scheduler.pending)
+metrics.gauge("idle_rooms", lambda: room_pool.idle_count())
+metrics.gauge("outbox_messages_queued", lambda: outbox_totals["queued"])
+metrics.gauge("outbox_api_calls", lambda: outbox_totals["calls"])
+metrics.gauge("rated_players", lambda: len(ratings))
+
+
+def configure_shard_worker(worker, shard_ids, shard_count, database="ratings.db"):
+    """
+    Make this process one of several, each running some of the shards.
 
-# load ratings from a JSON file
-def load_ratings():
-    try:
-        with open(ratings_file, "r") as f:
-            ratings_data = json.load(f)
-            ratings = {int(key): value for key, value in ratings_data.items()}
-            return ratings
-    except FileNotFoundError:
-        return {}
-    except json.JSONDecodeError:
-        return {}
+    Guilds, and so duels, rooms and matchmaking queues, never move between the
+    shards of a running bot, so only the ratings are shared, through `database`.
+    Checkpoints, replays and metrics get a file per worker; keep the same worker
+    numbers and shard split across restarts so each worker resumes its own duels.
+    Call before the bot starts.
+    """
+    global ratings, checkpoints, replay_store, metrics_file, metrics_port, command_sync_enabled
+    bot.shard_ids = list(shard_ids)
+    bot.shard_count = shard_count
+    ratings = SharedRatingsStore(database, import_from=ratings_file, load=False)
+    ratings.subscribe(rank_index.update)
+    checkpoints = CheckpointStore(f"checkpoints.{worker}.jsonl")
+    replay_store = ReplayStore(f"replays.{worker}.jsonl")
+    if metrics_file:
+        metrics_file = f"metrics.{worker}.prom"
+    if metrics_port:
+        metrics_port += worker
+    command_sync_enabled = worker == 0
+
+
+def load_data():
+    card_catalog.reload()
+    ratings.recover()
+    for player_id, rating in ratings.items():
+        rank_index.update(player_id, rating)
+    # before any new duel writes a checkpoint
+    resumable_duels[:] = checkpoints.load()
+
+
+async def setup_hook():
+    # runs before the gateway connection; load files in a thread while the slash commands sync
+    if command_sync_enabled:
+        await asyncio.gather(asyncio.to_thread(load_data), sync_command_tree(bot, force=force_command_sync))
+    else:
+        await asyncio.to_thread(load_data)
+    background_tasks.append(asyncio.create_task(card_catalog.watch()))
+    background_tasks.append(asyncio.create_task(monitor_loop_lag()))
+    background_tasks.append(asyncio.create_task(resume_duels()))
+    background_tasks.append(asyncio.create_task(run_matchmaking()))
+    if isinstance(ratings, SharedRatingsStore):
+        background_tasks.append(asyncio.create_task(ratings.watch(ratings_poll_interval)))
+    if metrics_file:
+        background_tasks.append(asyncio.create_task(export_to_file(metrics_file)))
+    if metrics_port:
+        await serve(metrics_port)
+
+
+bot.setup_hook = setup_hook
+
+
+@bot.listen("on_message")
+async def route_message(message):
+    # the bot's own posts (and other bots') are never a player's answer
+    if message.author.bot:
+        return
+    router.dispatch(message)
 
 
 def initialize_ratings(players):
-    ratings = load_ratings()
     for player in players:
-        if player.id not in ratings:
-            ratings[player.id] = 100  # Initial rating of 100
-    save_ratings(ratings)
+        if not player.bot:
+            ratings.setdefault(player.id, elo.initial_rating)
     return ratings
 
 
-def update_ratings(ratings, winner, loser):
-    winner_rating = ratings.get(winner.id, 100)
-    loser_rating = ratings.get(loser.id, 100)
-
-    # Calculate rating difference
-    rating_difference = loser_rating - winner_rating
+def rate_duel(winner_rating, loser_rating):
+    k = elo.k_factor(loser_rating - winner_rating)
+    return elo.rate(winner_rating, loser_rating, k)
 
-    # Determine rating change
-    if rating_difference <= 0:
-        k = 32
-    elif rating_difference <= 100:
-        k = 24
-    else:
-        k = 16
 
-    # Calculate new ratings
-    winner_new_rating = winner_rating + k * (1 - (1 / (1 + 10 ** (rating_difference / 400))))
-    loser_new_rating = loser_rating - k * (1 / (1 + 10 ** (rating_difference / 400)))
+def update_ratings(ratings, winner, loser):
+    # the store applies rate_duel to the ratings it holds; the shared store redoes it in a transaction
+    ratings.update_pair(winner.id, loser.id, rate_duel, elo.initial_rating)
 
-    # Update ratings
-    ratings[winner.id] = winner_new_rating
-    ratings[loser.id] = loser_new_rating
 
-    save_ratings(ratings)
+def record_result(winner, loser, draw=False, forfeit=False):
+    """
+    Logs a finished duel to the match history and, unless it was a draw, updates the ratings.
+    """
+    if winner.bot or loser.bot:
+        # duels against the bot are practice: not rated and not in the history
+        return
+    match_history.append(winner.id, loser.id, (DRAW if draw else 0) | (FORFEIT if forfeit else 0))
+    if not draw:
+        update_ratings(ratings, winner, loser)
+    report_tournament_result(winner, loser, draw)
 
 
 def get_player_rank(player):
-    sorted_players = sorted(ratings.items(), key=lambda x: x[1], reverse=True)
-    rank = [player_id for player_id, _ in sorted_players].index(player.id) + 1
-    return rank
+    return rank_index.rank(player.id)
 
 
 @bot.command(name='duel')
-async def duel(ctx, opponent: discord.Member):
+@metrics.timed("command_seconds", command="duel")
+async def duel(ctx, opponent: Union[discord.Member, Literal["bot"]]):
     """
-    Challenge another player to a duel!
-    Usage: !duel @opponent
+    Challenge another player, or the bot, to a duel!
+    Usage: !duel @opponent, !duel bot
     Example: !duel @Sherlock
     """
-    global duel_data
-    global ratings
-    duel_data[ctx.guild.id] = {
-        "player1": ctx.author,
-        "player2": opponent
-    }
-    global game_phase
-    game_phase = "planning"
-    player1 = ctx.author
-    player2 = opponent
-
-    overwrites = {
-        ctx.guild.default_role: discord.PermissionOverwrite(read_messages=False),
-        player1: discord.PermissionOverwrite(read_messages=True),
-        player2: discord.PermissionOverwrite(read_messages=True)
-    }
-
-    if ctx.author.id not in ratings:
-        initialize_ratings([ctx.author])
-    if opponent.id not in ratings:
-        initialize_ratings([opponent])
-
-    duel_channel = await ctx.guild.create_text_channel("duel-room", overwrites=overwrites)
-
-    guild_id = ctx.guild.id
-
-    duel_data[guild_id] = {"player1": player1, "player2": player2, "duel_channel": duel_channel}
+    if opponent == "bot":
+        opponent = ctx.guild.me
+    if not reserve_players(ctx.author, opponent):
+        await ctx.send("One of the players is already in a duel.")
+        return
+
+    await start_duel(ctx.guild, ctx.channel, ctx.author, opponent, f"Challenging {opponent.mention} to a duel!")
+
+
+async def start_duel(guild, lobby, player1, player2, intro):
+    """
+    Opens a duel room for two players reserved with `reserve_players`, announces it
+    in `lobby` and plays the duel.
+    """
+    session = await open_duel(guild, lobby, player1, player2, intro)
+    await play_duel(session)
+
+
+async def open_duel(guild, lobby, player1, player2, intro):
+    # a challenged or matched player stops waiting in the queue
+    matchmaker.leave(player1.id)
+    matchmaker.leave(player2.id)
+    initialize_ratings([player1, player2])
+
+    try:
+        duel_channel = await room_pool.lease(guild, lobby, player1, player2)
+    except BaseException:
+        release_players(player1, player2)
+        raise
+
+    session = open_session(guild.id, duel_channel, player1, player2)
+    session.outbox = ChannelOutbox(duel_channel)
+    session.panel = TurnPanel(session.outbox)
+    session.replay = ReplayRecorder(session)
+    outbox = session.outbox
     embed = discord.Embed(title="Duel Invitation", color=discord.Color.blurple())
     embed.add_field(name="Duel Room",
                     value=f"A duel room has been opened for {player1.mention} and {player2.mention}."
                           f" Click on this to start: {duel_channel.mention}")
 
-    await ctx.send(embed=embed)
+    await lobby.send(embed=embed)
 
+    outbox.queue(intro)
+
+    outbox.queue(f"{player1.mention} and {player2.mention}, get ready for a duel!")
+
+    card_embed = embed_cache.get("card_list", card_catalog.version, build_card_list_embed)
+    outbox.queue(embed=card_embed)
+    return session
+
+
+async def play_duel(session):
+    """
+    Runs a new or resumed duel to the end, then closes its session and room.
+    """
+    suspended = False
     try:
-        await duel_channel.send(f"Challenging {opponent.mention} to a duel!")
+        checkpoint(session)
+        if session.game is None:
+            await summon_cards(session)
+        else:
+            await start_game(session)
+    except asyncio.CancelledError:
+        # the bot is shutting down: keep the checkpoint and the room for the next process
+        suspended = True
+        raise
+    finally:
+        close_session(session)
+        if not suspended:
+            checkpoints.remove(session.channel_id)
+            save_replay(session)
+            # forcestopgame and forfeit release the room themselves
+            if session.phase != "stopped":
+                if turn_input == "components":
+                    await close_turn_panel(session, "This duel is over.")
+                await session.outbox.flush()
+                close_room_later(session.channel, room_close_delay)
+
+
+def halt_duel(session, notice):
+    """
+    Ends a duel without a result, e.g. when its tournament round runs out of time.
+    """
+    session.phase = "stopped"
+    session.game_over = True
+    close_session(session)
+    router.cancel_channel(session.channel_id)
+    session.outbox.queue(notice)
+    close_room_later(session.channel, forfeit_close_delay)
+
+
+def spawn_duel(coroutine):
+    task = asyncio.create_task(coroutine)
+    duel_tasks.add(task)
+    task.add_done_callback(duel_tasks.discard)
+    return task
+
+
+def start_match(ticket, opponent):
+    # the player who waited longer challenges
+    intro = (f"Matched {ticket.player.mention} (rating {round(ticket.rating)}) against "
+             f"{opponent.player.mention} (rating {round(opponent.rating)}).")
+    first, second = sorted((ticket, opponent), key=lambda t: t.joined_at)
+    if not reserve_players(first.player, second.player):
+        return None
+    return spawn_duel(start_duel(first.player.guild, first.channel, first.player, second.player, intro))
+
 
-        active_players[player1] = {"phase": "planning", "deck": [], "limbo": [], "health": 20}
-        active_players[player2] = {"phase": "planning", "deck": [], "limbo": [], "health": 20}
+async def run_matchmaking():
+    while True:
+        await asyncio.sleep(matchmaking_interval)
+        for ticket, opponent in matchmaker.tick():
+            start_match(ticket, opponent)
 
-        await duel_channel.send(f"{player1.mention} and {player2.mention}, get ready for a duel!")
 
-        card_embed = discord.Embed(title="List of Cards")
-        for card in card_data:
-            card_embed.add_field(
-                name=card['name'],
-                value=f"Attack: {card['attack']}\nHealth: {card['health']}\nAbility: {', '.join(card['ability'])}",
-                inline=True
-            )
+def report_tournament_result(winner, loser, draw):
+    tournament = tournaments.get(winner.guild.id)
+    if tournament is None or not tournament.started:
+        return
+    if tournament.report(winner.id, loser.id, draw) is not None and tournament.round_over:
+        tournament.round_done.set()
+
+
+async def play_tournament_match(tournament, match, slots, rooms):
+    first, second = match.first.player, match.second.player
 
-        await duel_channel.send(embed=card_embed)
-        await summon_cards(duel_channel, player1, player2)
+    def called_off():
+        # decided by the round's deadline, or the whole tournament was cancelled
+        return match.decided or tournament.cancelled
+
+    async with slots:
+        while not reserve_players(first, second):
+            if called_off():
+                return
+            await asyncio.sleep(tournament_busy_poll)
+        try:
+            if not called_off():
+                await rooms.acquire()
+        except BaseException:
+            release_players(first, second)
+            raise
+        if called_off():
+            release_players(first, second)
+            return
+        intro = f"Round {match.round} of the tournament: {first.mention} against {second.mention}."
+        match.session = await open_duel(tournament.channel.guild, tournament.channel, first, second, intro)
+        if called_off():
+            # the round ran out of time, or the tournament was cancelled, while the room was being opened
+            halt_duel(match.session, "This match of the tournament has been called off.")
+            return
+        await play_duel(match.session)
+
+
+async def end_tournament_round(tournament):
+    undecided = tournament.undecided()
+    for match in undecided:
+        tournament.time_out(match)
+    # the bracket moves on right away; the duels still running are only told to stop
+    tournament.round_done.set()
+    for match in undecided:
+        if match.session is not None and get_session(match.session.channel_id) is match.session:
+            winner = f" {match.winner.player.mention} goes through as the higher seed." if match.winner else ""
+            halt_duel(match.session, f"Time is up for this round of the tournament.{winner}")
+
+
+def describe_match(match):
+    first = match.first.player.mention
+    if match.second is None:
+        return f"{first} has a bye"
+    second = match.second.player.mention
+    if not match.decided:
+        return f"{first} vs {second}"
+    if match.winner is None:
+        return f"{first} and {second} drew" + (" (out of time)" if match.reason == "time" else "")
+    loser = match.loser.player.mention
+    return f"{match.winner.player.mention} beat {loser}" + (" (out of time)" if match.reason == "time" else "")
+
+
+async def run_tournament(tournament):
+    """
+    Plays every round of a tournament. All matches of a round are started at once, but
+    only `tournament_concurrency` duels run together and rooms are opened at most at
+    `tournament_room_rate` per `tournament_room_per` seconds. Whatever is not finished
+    after `tournament_round_time` seconds is decided by Tournament.time_out, so a round
+    never waits on Discord for longer than that.
+    """
+    lobby = ChannelOutbox(tournament.channel)
+    slots = asyncio.Semaphore(tournament_concurrency)
+    rooms = TokenBucket(tournament_room_rate, tournament_room_per)
+    deadline_key = ("tournament_round", tournament.guild_id)
+    try:
+        while not tournament.finished:
+            tournament.round_done = asyncio.Event()
+            matches = tournament.next_round()
+            lobby.queue(f"**Round {tournament.round}** of the tournament. You have "
+                        f"{tournament_round_time / 60:g} minutes to finish your duel.")
+            for match in matches:
+                lobby.queue(describe_match(match))
+            await lobby.flush()
+
+            for match in tournament.undecided():
+                match.task = spawn_duel(play_tournament_match(tournament, match, slots, rooms))
+            if not tournament.round_over:
+                scheduler.call_later(tournament_round_time, end_tournament_round, tournament, key=deadline_key)
+                await tournament.round_done.wait()
+                scheduler.cancel(deadline_key)
+
+            lobby.queue(f"**Round {tournament.round} results**")
+            for match in matches:
+                if match.second is not None:
+                    lobby.queue(describe_match(match))
+            await lobby.flush()
+
+        embed = discord.Embed(title="Tournament Results", color=discord.Color.gold())
+        embed.description = "\n".join(f"{place}. {entrant.player.mention} ({entrant.score:g} points)"
+                                      for place, entrant in enumerate(tournament.standings()[:10], 1))
+        await lobby.send(f"{tournament.champion.player.mention} wins the tournament!", embed=embed)
     finally:
-        await asyncio.sleep(6)
-        await duel_channel.delete()
+        scheduler.cancel(deadline_key)
+        if tournaments.get(tournament.guild_id) is tournament:
+            del tournaments[tournament.guild_id]
+
+
+def save_replay(session):
+    game = session.game
+    if game is not None and game.phase == engine.OVER:
+        session.replay.end("forfeit" if session.phase == "stopped" else "over", game.winner)
+    else:
+        session.replay.end(session.phase, None)
+    replay_store.save(session.replay)
+
+
+def checkpoint(session):
+    checkpoints.save(snapshot(session))
+
+
+async def restore_session(data):
+    channel = bot.get_channel(data["channel"])
+    if channel is None:
+        try:
+            channel = await bot.fetch_channel(data["channel"])
+        except discord.HTTPException:
+            return None
+
+    players = []
+    for player_id in data["players"]:
+        member = channel.guild.get_member(player_id)
+        if member is None:
+            try:
+                member = await channel.guild.fetch_member(player_id)
+            except discord.HTTPException:
+                return None
+        players.append(member)
+
+    room_pool.adopt(channel.guild.id, channel, players[0], players[1])
+    session = open_session(channel.guild.id, channel, players[0], players[1])
+    session.phase = data["phase"]
+    for player, (phase, limbo) in zip(players, restore_summon(data["summon"])):
+        session.state(player)["phase"] = phase
+        session.state(player)["limbo"] = limbo
+    session.game = restore_game(data["game"])
+    session.outbox = ChannelOutbox(channel)
+    session.panel = TurnPanel(session.outbox)
+    session.replay = ReplayRecorder(session, resumed_from=data)
+    return session
+
+
+async def resume_duels():
+    """
+    Picks up the duels that were in progress when the bot last stopped.
+    """
+    await bot.wait_until_ready()
+    snapshots, resumable_duels[:] = list(resumable_duels), []
+    for data in snapshots:
+        session = await restore_session(data)
+        if session is None:
+            # the room or one of the players is gone
+            checkpoints.remove(data["channel"])
+            continue
+        session.outbox.queue(f"{session.player1.mention} and {session.player2.mention}, the bot restarted. "
+                             f"Your duel continues where it left off.")
+        spawn_duel(play_duel(session))
+    print(f"resumed {len(duel_sessions)} duel(s)")
+    # rooms hidden by an earlier process that no resumed duel took back
+    for guild in bot.guilds:
+        await room_pool.recover(guild)
+
+
+def close_room_later(channel, delay):
+    # a deadline instead of a sleeping coroutine per finished duel
+    scheduler.call_later(delay, room_pool.release, channel, key=("close_room", channel.id))
+
+
+def build_card_list_embed():
+    card_embed = discord.Embed(title="List of Cards")
+    for card in card_catalog:
+        card_embed.add_field(
+            name=card.name,
+            value=f"Attack: {card.attack}\nHealth: {card.health}\nAbility: {', '.join(card.ability)}",
+            inline=True
+        )
+    return card_embed
+
+
+def build_help_embed():
+    embed = discord.Embed(title="Bot Commands", color=discord.Color.orange())
+
+    for command in sorted(bot.commands, key=lambda c: c.name):
+        command_name = f"**__{command.name}:__**"
+        command_description = command.help
+        embed.add_field(name=command_name, value=command_description, inline=False)
+    return embed
 
 
-async def summon_cards(duel_channel, player1, player2):
-    global game_phase
-    game_phase = "planning"
+def command_set_version():
+    return hash(tuple(sorted((command.name, command.help) for command in bot.commands)))
+
+
+@metrics.timed("duel_phase_seconds", phase="summon")
+async def summon_cards(session):
+    duel_channel = session.channel
+    outbox = session.outbox
+    player1 = session.player1
+    player2 = session.player2
+    session.phase = "planning"
 
     def check(message):
-        return ((message.author == player1 or message.author == player2) and message.content.lower() != "done"
-                and message.channel == duel_channel)
+        return message.content.lower() != "done"
 
-    for player in [player1, player2]:
-        # Start the summoning phase message
-        summon_phase_embed = discord.Embed(title=f"Summoning Phase for {player.display_name}",
-                                           description="Summon your cards one by one. (Please select 3 cards)",
-                                           color=discord.Color.blue())
+    # the bot summons through summon_bot_cards, never through a message
+    human_ids = [player.id for player in session.seats if not player.bot]
 
-        # Send the initial summoning phase message
-        summon_msg = await duel_channel.send(embed=summon_phase_embed)
+    for seat, player in enumerate([player1, player2]):
+        if session.state(player)["phase"] == "ready":
+            # summoned before a restart
+            continue
+        if player.bot:
+            await summon_bot_cards(session, seat, player)
+            session.state(player)["phase"] = "ready"
+            checkpoint(session)
+            continue
+        summoned_cards = session.state(player)["limbo"]
+
+        # Start the summoning phase message
+        if turn_input == "components":
+            await show_summon_menu(session, player, "Pick 3 cards from the menu, or type their names one by one.")
+        else:
+            summon_phase_embed = discord.Embed(title=f"Summoning Phase for {player.display_name}",
+                                               description="Summon your cards one by one. (Please select 3 cards)",
+                                               color=discord.Color.blue())
 
-        summoned_cards = []
+            # Send the initial summoning phase message
+            outbox.queue(embed=summon_phase_embed)
 
         while len(summoned_cards) < 3:
+            if session.phase == "stopped":
+                return
             try:
-                response = await bot.wait_for("message", timeout=120.0, check=check)
+                await outbox.flush()
+                response = await router.wait(duel_channel.id, human_ids, accept=check, timeout=120.0)
+                if response is None:
+                    return
 
                 if response.content.lower() == "done":
                     if len(summoned_cards) == 3:
@@ -178,348 +580,648 @@ async def summon_cards(duel_channel, player1, player2):
                         done_embed = discord.Embed(title="Summoning Phase",
                                                    description="You need to summon 3 cards before typing 'done'.",
                                                    color=discord.Color.red())
-                        await duel_channel.send(embed=done_embed)
+                        outbox.queue(embed=done_embed)
                 elif player == response.author:
-                    card_name = response.content.lower()
-                    card = next((c for c in card_data if c["name"].lower() == card_name), None)
-                    if card:
-                        if card in summoned_cards:
-                            duplicate_embed = discord.Embed(title="Summoning Phase",
-                                                            description="You can't choose the same card more than "
-                                                                        "once.",
-                                                            color=discord.Color.red())
-                            await duel_channel.send(embed=duplicate_embed)
-                        else:
-                            if len(summoned_cards) < 3:
-                                card["identifier"] = uuid.uuid4()
-                                summoned_cards.append(card)
-                                summon_success_embed = discord.Embed(title="Summoning Phase",
-                                                                     description=f"You summoned {card['name']}.",
-                                                                     color=discord.Color.green())
-                                await duel_channel.send(embed=summon_success_embed)
-                                print(summoned_cards)
-
-                            else:
-                                limit_exceeded_embed = discord.Embed(title="Summoning Phase",
-                                                                     description="You can't have more than "
-                                                                                 "3 cards in your deck.",
-                                                                     color=discord.Color.red())
-                                await duel_channel.send(embed=limit_exceeded_embed)
+                    # a summon menu pick carries several names, a typed message one
+                    if isinstance(response, ComponentInput):
+                        card_names = response.values
                     else:
-                        not_in_collection_embed = discord.Embed(title="Summoning Phase",
-                                                                description=f"{player.mention} You don't"
-                                                                            f" have {card_name} in your collection.",
+                        card_names = [response.content.lower()]
+                    for card_name in card_names:
+                        card = card_catalog.get(card_name)
+                        if card:
+                            if any(summoned.name == card.name for summoned in summoned_cards):
+                                duplicate_embed = discord.Embed(title="Summoning Phase",
+                                                                description="You can't choose the same card more than "
+                                                                            "once.",
                                                                 color=discord.Color.red())
-                        await duel_channel.send(embed=not_in_collection_embed)
+                                outbox.queue(embed=duplicate_embed)
+                            else:
+                                if len(summoned_cards) < 3:
+                                    # identifiers only need to be unique within this duel
+                                    summoned_cards.append(card.instance(seat * 3 + len(summoned_cards)))
+                                    session.replay.summon(seat, summoned_cards[-1])
+                                    summon_success_embed = discord.Embed(title="Summoning Phase",
+                                                                         description=f"You summoned {card.name}.",
+                                                                         color=discord.Color.green())
+                                    outbox.queue(embed=summon_success_embed)
+
+                                else:
+                                    limit_exceeded_embed = discord.Embed(title="Summoning Phase",
+                                                                         description="You can't have more than "
+                                                                                     "3 cards in your deck.",
+                                                                         color=discord.Color.red())
+                                    outbox.queue(embed=limit_exceeded_embed)
+                        else:
+                            description = f"{player.mention} You don't have {card_name} in your collection."
+                            suggestions = card_catalog.suggest(card_name)
+                            if suggestions:
+                                description += f" Did you mean {' or '.join(s.name for s in suggestions)}?"
+                            not_in_collection_embed = discord.Embed(title="Summoning Phase",
+                                                                    description=description,
+                                                                    color=discord.Color.red())
+                            outbox.queue(embed=not_in_collection_embed)
+                    if isinstance(response, ComponentInput) and len(summoned_cards) < 3:
+                        await show_summon_menu(session, player, f"Pick {3 - len(summoned_cards)} more.")
                 else:
                     unauthorized_embed = discord.Embed(title="Summoning Phase",
                                                        description="Only the mentioned players can summon cards.",
                                                        color=discord.Color.red())
-                    await duel_channel.send(embed=unauthorized_embed)
+                    outbox.queue(embed=unauthorized_embed)
             except asyncio.TimeoutError:
                 timeout_embed = discord.Embed(title="Summoning Phase",
                                               description="Time's up for this phase!",
                                               color=discord.Color.red())
-                await duel_channel.send(embed=timeout_embed)
+                outbox.queue(embed=timeout_embed)
                 break
 
-        active_players[player]["limbo"] = summoned_cards
+        session.state(player)["phase"] = "ready"
+        checkpoint(session)
 
-    await start_game(duel_channel, player1, player2)
+    await start_game(session)
 
 
-async def start_game(duel_channel, player1, player2):
-    global game_phase
-    global game_over
+async def run_ai(function, *args):
+    """
+    Runs an ai.py search off the event loop, in a worker process if ai_processes is set.
+    """
+    global ai_pool
+    if ai_processes and ai_pool is None:
+        # spawned, not forked: this process already runs writer threads and SQLite connections
+        ai_pool = ProcessPoolExecutor(ai_processes, mp_context=multiprocessing.get_context("spawn"))
+    budget = ai_process_budget if ai_processes else ai_move_budget
+    return await asyncio.get_running_loop().run_in_executor(ai_pool, function, *args, budget)
+
+
+async def summon_bot_cards(session, seat, player):
+    summoned_cards = session.state(player)["limbo"]
+    opponent_deck = tuple(session.state(session.opponent(player))["limbo"])
+    names = await run_ai(ai.choose_deck, card_catalog.templates, opponent_deck, seat)
+    for name in names:
+        card = card_catalog.get(name)
+        if len(summoned_cards) < 3 and not any(summoned.name == card.name for summoned in summoned_cards):
+            summoned_cards.append(card.instance(seat * 3 + len(summoned_cards)))
+            session.replay.summon(seat, summoned_cards[-1])
+    summon_embed = discord.Embed(title="Summoning Phase",
+                                 description=f"{player.display_name} summoned "
+                                             f"{', '.join(card.name for card in summoned_cards)}.",
+                                 color=discord.Color.green())
+    session.outbox.queue(embed=summon_embed)
+
+
+async def choose_bot_card(session, player):
+    seat = session.seat(player)
+    game = session.game
+    identifier = await run_ai(ai.choose_card, game, seat)
+    return engine.find_card(game, seat, identifier)
+
+
+async def show_summon_menu(session, player, description):
+    embed = discord.Embed(title=f"Summoning Phase for {player.display_name}", description=description,
+                          color=discord.Color.blue())
+    count = 3 - len(session.state(player)["limbo"])
+    session.panel.turn = player.id
+    await session.outbox.post(embed=embed, view=summon_view(session.channel_id, card_catalog.templates, count))
+
+
+async def start_game(session):
+    if session.game is None:
+        session.game = engine.new_game(session.state(session.player1)["limbo"],
+                                       session.state(session.player2)["limbo"])
+    session.phase = "battle"
     while True:
-        await start_battle_phase(duel_channel, player1, player2)
-        if game_over:
-            active_players[player1] = {"limbo": []}
-            active_players[player2] = {"limbo": []}
-            game_phase = "planning"
-            game_over = True
+        if await is_game_over(session):
+            session.phase = "planning"
             break
-        if await is_game_over(duel_channel, player1, player2):
-            active_players[player1] = {"limbo": []}
-            active_players[player2] = {"limbo": []}
-            game_phase = "planning"
-            game_over = True
+        elif session.phase in ("stopped", "timed_out"):
             break
-        elif game_phase == "stopped":
-            break
-
-
-async def is_game_over(duel_channel, player1, player2):
-    global game_over
-    for card in active_players[player1]["limbo"]:
-        if card["health"] <= 0:
-            print(player1)
-            print(f"removed {card}")
-            active_players[player1]["limbo"].remove(card)
-            print(active_players[player1]["limbo"])
-    for card in active_players[player2]["limbo"]:
-        if card["health"] <= 0:
-            print(player2)
-            print(f"removed {card}")
-            active_players[player2]["limbo"].remove(card)
-            print(active_players[player2]["limbo"])
-
-    if not active_players[player1]["limbo"] and not active_players[player2]["limbo"]:
-        await duel_channel.send("It's a draw! Both players have no cards left. This channel will be deleted shortly.")
-        game_over = True
-    elif not active_players[player1]["limbo"]:
-        await duel_channel.send(f"{player2.mention} has won the match. This channel will be deleted shortly.")
-        game_over = True
-        update_ratings(ratings, player1, player2)
-    elif not active_players[player2]["limbo"]:
-        await duel_channel.send(f"{player1.mention} has won the match. This channel will be deleted shortly.")
-        game_over = True
-        update_ratings(ratings, player1, player2)
-    print("Game is not over")
-    return game_over
-
-
-async def start_battle_phase(duel_channel, player1, player2):
-    used_identifiers = []
-
-    for attacker, defender in [(player1, player2), (player2, player1)]:
-        await duel_channel.send(f"{attacker.mention}, choose a card to attack with:")
-        await display_player_cards(duel_channel, attacker)
-
-        attacker_card_name = await get_chosen_card(duel_channel, attacker)
-        attacker_card_identifier = next(
-            card["identifier"] for card in active_players[attacker]["limbo"]
-            if card["name"].lower() == attacker_card_name.lower()
-        )
-
-        attacker_card = next(
-            c for c in active_players[attacker]["limbo"]
-            if c["name"].lower() == attacker_card_name.lower() and c["identifier"] == attacker_card_identifier
-        )
+        await start_battle_phase(session)
+        if session.phase == "battle":
+            checkpoint(session)
+
+
+async def is_game_over(session):
+    if session.game_over:
+        return True
+    if session.game.phase != engine.OVER:
+        return False
+
+    session.game_over = True
+    outbox = session.outbox
+    if session.game.winner == engine.DRAW:
+        outbox.queue("It's a draw! Both players have no cards left. This room will be closed shortly.")
+        record_result(session.player1, session.player2, draw=True)
+    else:
+        winner = session.seats[session.game.winner]
+        outbox.queue(f"{winner.mention} has won the match. This room will be closed shortly.")
+        record_result(winner, session.opponent(winner))
+    return True
 
-        if not attacker_card:
-            await duel_channel.send(f"{attacker.mention}, you don't have {attacker_card_name} in your limbo.")
-            continue
 
-        await duel_channel.send(f"{defender.mention}, choose a card to defend:")
-        await display_player_cards(duel_channel, defender)
+@metrics.timed("duel_phase_seconds", phase="battle_exchange")
+async def start_battle_phase(session):
+    """
+    Plays one exchange: the attacker picks a card, then the defender picks one to block it.
+    """
+    outbox = session.outbox
+    attacker = session.seats[session.game.attacker]
+    defender = session.opponent(attacker)
+
+    for player, kind, prompt in [(attacker, engine.ATTACK, "choose a card to attack with:"),
+                                 (defender, engine.DEFEND, "choose a card to defend:")]:
+        if player.bot:
+            card = await choose_bot_card(session, player)
+        else:
+            if turn_input == "components":
+                await show_turn_panel(session, player, kind, f"{player.mention}, {prompt}")
+            else:
+                outbox.queue(f"{player.mention}, {prompt}")
+                await display_player_cards(session, player)
 
-        defender_card_name = await get_chosen_card(duel_channel, defender)
-        defender_card_identifier = next(
-            card["identifier"] for card in active_players[defender]["limbo"]
-            if card["name"].lower() == defender_card_name.lower()
-        )
+            card = await get_chosen_card(session, player)
+        if session.phase == "stopped":
+            return
+        if card is None:
+            # the player let the clock run out; the room is released like any finished duel's
+            session.phase = "timed_out"
+            outbox.queue("The duel has ended: time ran out. This room will be closed shortly.")
+            return
 
-        defender_card = next(
-            c for c in active_players[defender]["limbo"]
-            if c["name"].lower() == defender_card_name.lower() and c["identifier"] == defender_card_identifier
-        )
+        with metrics.timer("duel_phase_seconds", phase=kind):
+            action = engine.Action(kind, session.seat(player), card.identifier)
+            session.game, events = engine.apply_action(session.game, action)
+            session.replay.action(action, events)
+            for event in events:
+                line = describe_event(session, event)
+                if not line:
+                    continue
+                if turn_input == "components":
+                    session.panel.add_log(line)
+                else:
+                    outbox.log(line)
 
-        if not defender_card:
-            await duel_channel.send(f"{defender.mention}, you don't have {defender_card_name} in your limbo.")
-            continue
 
-        await duel_channel.send(f"{attacker.mention} attacks with {attacker_card['name']}!")
-        await duel_channel.send(f"{defender.mention} defends with {defender_card['name']}!")
+def describe_event(session, event):
+    if event.kind == "attack":
+        return f"{session.seats[event.seat].mention} attacks with {event.card}!"
+    if event.kind == "defend":
+        return f"{session.seats[event.seat].mention} defends with {event.card}!"
+    if event.kind == "damage":
+        return f"{event.card} took {event.value} damage!"
+    return None
 
-        # Calculate damage and update health
-        attacker_damage = attacker_card["attack"]
-        defender_damage = defender_card["attack"]
 
-        attacker_card_copy = attacker_card.copy()
-        defender_card_copy = defender_card.copy()
+def build_cards_embed(player, player_limbo):
+    if not player_limbo:
+        return discord.Embed(title=f"{player.display_name}'s Available Cards", description="No cards available.",
+                             color=discord.Color.blue())
+    embed = discord.Embed(title=f"{player.display_name}'s Available Cards", color=discord.Color.blue())
+    for card in player_limbo:
+        if card.health > 0:
+            embed.add_field(
+                name=card.name,
+                value=f"Attack: {card.attack}\nHealth: {card.health}",
+                inline=True
 
-        attacker_card_copy["health"] -= defender_damage
-        defender_card_copy["health"] -= attacker_damage
+            )
+    return embed
 
-        active_players[attacker]["limbo"] = [
-            card if card["identifier"] != attacker_card["identifier"] else attacker_card_copy for card in
-            active_players[attacker]["limbo"]]
-        active_players[defender]["limbo"] = [
-            card if card["identifier"] != defender_card["identifier"] else defender_card_copy for card in
-            active_players[defender]["limbo"]]
 
-        used_identifiers.extend([attacker_card_identifier, defender_card_identifier])
-        await duel_channel.send(f"{defender_card['name']} took {attacker_damage} damage!")
-        await duel_channel.send(f"{attacker_card['name']} took {defender_damage} damage!")
+async def display_player_cards(session, player):
+    player_limbo = session.limbo(player)
+    # card instances are immutable, so the limbo itself identifies what the embed shows
+    version = (player.display_name, tuple(player_limbo))
+    embed = embed_cache.get(("cards", session.channel_id, player.id), version,
+                            lambda: build_cards_embed(player, player_limbo))
+    session.outbox.queue(embed=embed)
 
-        if await is_game_over(duel_channel, player1, player2):
-            break
 
+async def show_turn_panel(session, player, kind, prompt):
+    session.panel.turn = player.id
+    embed = embed_cache.get(("cards", session.channel_id, player.id),
+                            (player.display_name, tuple(session.limbo(player))),
+                            lambda: build_cards_embed(player, session.limbo(player))).copy()
+    if session.panel.log:
+        embed.add_field(name="Battle Log", value="\n".join(session.panel.log), inline=False)
+    await session.panel.show(content=prompt, embed=embed,
+                             view=turn_view(session.channel_id, kind, session.limbo(player),
+                                            session.panel.selection.get(player.id)))
 
-async def display_player_cards(duel_channel, player):
-    player_limbo = active_players[player]["limbo"]
 
-    if not player_limbo:
-        embed = discord.Embed(title=f"{player.display_name}'s Available Cards", description="No cards available.",
+async def close_turn_panel(session, content):
+    if session.panel.message is None and session.panel.interaction is None:
+        return
+    embed = None
+    if session.panel.log:
+        embed = discord.Embed(title="Battle Log", description="\n".join(session.panel.log),
                               color=discord.Color.blue())
-    else:
-        embed = discord.Embed(title=f"{player.display_name}'s Available Cards", color=discord.Color.blue())
-        for card in player_limbo:
-            if card["health"] > 0:
-                embed.add_field(
-                    name=card['name'],
-                    value=f"Attack: {card['attack']}\nHealth: {card['health']}",
-                    inline=True
+    await session.panel.show(content=content, embed=embed, view=None)
+
 
-                )
+@bot.listen("on_interaction")
+async def route_interaction(interaction):
+    if interaction.type != discord.InteractionType.component:
+        return
+    parsed = parse_custom_id(interaction.data.get("custom_id", ""))
+    if parsed is None:
+        return
+    action, channel_id = parsed
+    session = get_session(channel_id)
+    if session is None:
+        await interaction.response.send_message("This duel is over.", ephemeral=True)
+        return
+    if session.panel.turn != interaction.user.id or not router.is_waiting(channel_id, interaction.user.id):
+        await interaction.response.send_message("It's not your turn.", ephemeral=True)
+        return
 
-    await duel_channel.send(embed=embed)
+    values = interaction.data.get("values", [])
+    if action == "summon":
+        # the summon results are posted below, so the menu just goes away
+        await interaction.response.edit_message(view=None)
+        router.dispatch(ComponentInput(session.channel, interaction.user, "", interaction, values))
+    elif action == "card":
+        session.panel.selection[interaction.user.id] = int(values[0])
+        await interaction.response.defer()
+    elif action in (engine.ATTACK, engine.DEFEND):
+        selected = session.panel.selection.pop(interaction.user.id, None)
+        cards = [card for card in session.limbo(interaction.user) if card.health > 0]
+        card = next((card for card in cards if card.identifier == selected), None)
+        if card is None and len(cards) == 1:
+            card = cards[0]
+        if card is None:
+            await interaction.response.send_message("Choose a card first.", ephemeral=True)
+            return
+        # the duel answers this click with its next panel update
+        session.panel.interaction = interaction
+        choice = ComponentInput(session.channel, interaction.user, card.name, interaction, [card.identifier])
+        if router.dispatch(choice):
+            scheduler.call_later(interaction_ack_delay, session.panel.acknowledge, interaction)
+        else:
+            session.panel.interaction = None
+            await interaction.response.send_message("You can't play that card now.", ephemeral=True)
 
 
 # function to get chosen card from the player
-async def get_chosen_card(duel_channel, player):
-    used_identifiers = []
+async def get_chosen_card(session, player):
+
+    def find_card(content):
+        # exact card name or an unambiguous prefix of one, among the player's own cards rather
+        # than the catalog, which a reload may have changed since this duel's cards were summoned
+        text = content.strip().casefold()
+        if not text:
+            return None
+        cards = [card for card in session.limbo(player) if card.health > 0]
+        card = next((card for card in cards if card.name.casefold() == text), None)
+        if card is None:
+            names = {card.name for card in cards if card.name.casefold().startswith(text)}
+            if len(names) == 1:
+                card = next(card for card in cards if card.name in names)
+        return card
 
     def check(message):
-        return message.author == player and any(
-            card["name"].lower() in message.content.lower() and card["identifier"] not in used_identifiers
-            for card in active_players[player]["limbo"]
-        )
+        return find_card(message.content) is not None
 
     try:
-        response = await bot.wait_for("message", timeout=120.0, check=check)
-        chosen_card_name_lower = next(
-            card["name"].lower() for card in active_players[player]["limbo"]
-            if card["name"].lower() in response.content.lower() and card["identifier"] not in used_identifiers
-        )
-
-        chosen_card_identifier = next(
-            card["identifier"] for card in active_players[player]["limbo"]
-            if card["name"].lower() == chosen_card_name_lower and card["identifier"] not in used_identifiers
-        )
-
-        used_identifiers.append(chosen_card_identifier)
-
-        return chosen_card_name_lower
+        await session.outbox.flush()
+        response = await router.wait(session.channel_id, [player.id], accept=check, timeout=120.0)
+        if response is None:
+            return None
+        if isinstance(response, ComponentInput):
+            # the button names the exact card, even among cards with the same name
+            return next(card for card in session.limbo(player) if card.identifier == response.values[0])
+        return find_card(response.content)
     except asyncio.TimeoutError:
-        await duel_channel.send(f"{player.mention}, time's up to choose a card for the attack!")
+        if session.phase != "stopped":
+            session.outbox.queue(f"{player.mention}, time's up to choose a card for the attack!")
         return None
 
 
 @bot.tree.command(name="ping", description="shows the bot's latency in ms.")
+@metrics.timed("command_seconds", command="ping")
 async def ping(interaction: discord.Interaction):
     bot_latency = round(bot.latency * 1000)
     await interaction.response.send_message(f"Pong! {bot_latency} ms.")
 
 
 @bot.tree.command(name="shutdown", description="Shuts down the bot (admin only)")
+@metrics.timed("command_seconds", command="shutdown")
 async def shutdown(interaction: discord.Interaction):
-    allowed_user_id = 386162509943668758
-    if interaction.user.id == allowed_user_id:
+    global shutdown_requested
+    if interaction.user.id == admin_user_id:
         await interaction.response.send_message("Shutting down the bot.")
+        shutdown_requested = True
         await bot.close()
+        ratings.close()
     else:
         await interaction.response.send_message("Sorry, you are not authorized to use this command.")
 
 
 @bot.tree.command(name="help", description="displays all commands")
+@metrics.timed("command_seconds", command="help")
 async def help(interaction: discord.Interaction):
-    embed = discord.Embed(title="Bot Commands", color=discord.Color.orange())
+    embed = embed_cache.get("help", command_set_version(), build_help_embed)
+    await interaction.response.send_message(embed=embed)
 
-    for command in bot.commands:
-        embed.add_field(name=f"**__{command.name}:__**", value=command.help, inline=False)
 
-    await interaction.response.send_message(embed=embed)
+def format_histograms(name, label):
+    rows = []
+    for (metric_name, labels), histogram in metrics.histograms.items():
+        if metric_name == name:
+            rows.append((dict(labels).get(label, "-"), histogram))
+    rows.sort(key=lambda row: row[1].count, reverse=True)
+    return "\n".join(f"{value[:28]:<28} {histogram.count:>7} {histogram.percentile(0.5) * 1000:>7.1f} "
+                     f"{histogram.percentile(0.99) * 1000:>8.1f}" for value, histogram in rows[:8])
+
+
+def build_stats_embed():
+    embed = discord.Embed(title="Bot Stats", color=discord.Color.dark_teal())
+    header = f"{'':<28} {'count':>7} {'p50 ms':>7} {'p99 ms':>8}\n"
+    for title, name, label in [("Commands", "command_seconds", "command"),
+                               ("Duel phases", "duel_phase_seconds", "phase"),
+                               ("Discord API", "discord_api_seconds", "route")]:
+        rows = format_histograms(name, label)
+        embed.add_field(name=title, value=f"```{header}{rows}```" if rows else "No data yet.", inline=False)
+
+    lag = metrics.histograms.get(("event_loop_lag_seconds", ()))
+    api_errors = sum(value for (name, _), value in metrics.counters.items() if name == "discord_api_errors")
+    embed.add_field(name="Event loop lag",
+                    value=f"p50 {lag.percentile(0.5) * 1000:.1f} ms, p99 {lag.percentile(0.99) * 1000:.1f} ms"
+                    if lag else "No data yet.", inline=False)
+    embed.add_field(name="Duels", value=f"{len(duel_sessions)} active, {len(matchmaker)} queued, "
+                                        f"{router.pending} waiting for a player, "
+                                        f"{scheduler.pending} pending deadlines, "
+                                        f"{room_pool.idle_count()} idle rooms", inline=False)
+    embed.add_field(name="Messages", value=f"{outbox_totals['queued']} queued, {outbox_totals['calls']} API calls "
+                                           f"({outbox_totals['queued'] - outbox_totals['calls']} saved), "
+                                           f"{api_errors} API errors", inline=False)
+    if profiler.samples:
+        lines = [f"{share:>5.1%} {stack[0]}" for stack, share in profiler.top(5)]
+        embed.add_field(name="Profiler" + (" (running)" if profiler.running else ""),
+                        value="```" + "\n".join(lines)[:1000] + "```", inline=False)
+    return embed
+
+
+@bot.tree.command(name="stats", description="Shows command, duel and API timings (admin only)")
+@metrics.timed("command_seconds", command="stats")
+async def stats(interaction: discord.Interaction):
+    if interaction.user.id == admin_user_id:
+        await interaction.response.send_message(embed=build_stats_embed(), ephemeral=True)
+    else:
+        await interaction.response.send_message("Sorry, you are not authorized to use this command.")
+
+
+@bot.tree.command(name="profiler", description="Starts or stops the sampling profiler (admin only)")
+async def profile(interaction: discord.Interaction, enabled: bool):
+    if interaction.user.id != admin_user_id:
+        await interaction.response.send_message("Sorry, you are not authorized to use this command.")
+        return
+    if enabled:
+        profiler.start()
+        await interaction.response.send_message("Profiler started, see /stats for the results.", ephemeral=True)
+    else:
+        profiler.stop()
+        await interaction.response.send_message("Profiler stopped.", ephemeral=True)
 
 
 @bot.command()
-async def forcestopgame(ctx):
+@metrics.timed("command_seconds", command="forcestopgame")
+async def forcestopgame(ctx, duel_channel: discord.TextChannel = None):
     """
     Forcefully stops a duel (Admin)
+    Usage: !forcestopgame [#duel-room]
     """
     if ctx.author.guild_permissions.administrator:
-        global game_phase
-        duel_channel = None
+        # Use the given room, the room this was sent in, or any duel room in this guild
+        lease = room_pool.get((duel_channel or ctx.channel).id)
+        if lease is None:
+            lease = next((room_pool.get(room.id) for room in room_pool.guild_rooms(ctx.guild.id)), None)
+
+        if lease is not None:
+            session = get_session(lease.channel.id)
+            if session is not None:
+                session.phase = "stopped"
+                session.game_over = True
+                close_session(session)
+                session.outbox.close()
+            router.cancel_channel(lease.channel.id)
+            scheduler.cancel(("close_room", lease.channel.id))
+            await room_pool.release(lease.channel)
+            if lease.channel != ctx.channel:
+                await ctx.send("The game has been force stopped, and the duel room has been closed.")
+        else:
+            await ctx.send("No active duel room found.")
+    else:
+        await ctx.send("You need to have the administrator role to use this command.")
+
+
+@bot.command(name="queue")
+@metrics.timed("command_seconds", command="queue")
+async def queue(ctx):
+    """
+    Wait for an opponent with a rating close to yours.
+    Usage: !queue
+    """
+    if in_duel(ctx.author.id):
+        await ctx.send("You are already in a duel.")
+        return
+    if ctx.author.id in matchmaker:
+        await ctx.send("You are already in the matchmaking queue. Use !unqueue to leave it.")
+        return
+
+    rating = ratings.get(ctx.author.id, elo.initial_rating)
+    match = matchmaker.join(ctx.author, ctx.channel, rating)
+    if match is not None:
+        start_match(*match)
+        return
+    await ctx.send(f"{ctx.author.mention} joined the matchmaking queue with a rating of {round(rating)}. "
+                   f"You will be matched with a player near your rating.")
+
+
+@bot.command(name="unqueue")
+@metrics.timed("command_seconds", command="unqueue")
+async def unqueue(ctx):
+    """
+    Leave the matchmaking queue.
+    Usage: !unqueue
+    """
+    if matchmaker.leave(ctx.author.id) is None:
+        await ctx.send("You are not in the matchmaking queue.")
+    else:
+        await ctx.send("You left the matchmaking queue.")
 
-        # Find the duel_channel using its name
-        for channel in ctx.guild.channels:
-            if isinstance(channel, discord.TextChannel) and channel.name == 'duel-room':
-                duel_channel = channel
-                break
 
-        if duel_channel is not None:
-            game_phase = "stopped"
-            await duel_channel.delete()
-            await ctx.send("The game has been force stopped, and the duel room has been deleted.")
+@bot.command(name="tournament")
+@metrics.timed("command_seconds", command="tournament")
+async def tournament_command(ctx, action: str = "status", *options):
+    """
+    Single elimination or Swiss tournaments, one per server at a time
+    Usage: !tournament open [single|swiss] [rounds] (Admin), !tournament join, !tournament leave,
+    !tournament begin (Admin), !tournament status, !tournament cancel (Admin)
+    """
+    current = tournaments.get(ctx.guild.id)
+    action = action.lower()
+    if action in ("open", "begin", "cancel") and not ctx.author.guild_permissions.administrator:
+        await ctx.send("You need to have the administrator role to use this command.")
+        return
+
+    if action == "open":
+        if current is not None:
+            await ctx.send("There is already a tournament on this server.")
+            return
+        format = options[0].lower() if options else "single"
+        if format not in tournament_formats or (len(options) > 1 and not options[1].isdigit()):
+            await ctx.send("Usage: !tournament open [single|swiss] [rounds]")
+            return
+        rounds = int(options[1]) if len(options) > 1 else None
+        tournaments[ctx.guild.id] = Tournament(ctx.guild.id, ctx.channel, ctx.author, format, rounds)
+        await ctx.send(f"A {'Swiss' if format == 'swiss' else 'single elimination'} tournament is open. "
+                       f"Type !tournament join to enter.")
+    elif current is None:
+        await ctx.send("There is no tournament on this server. An admin can start one with !tournament open.")
+    elif action == "join":
+        if current.started:
+            await ctx.send("The tournament has already begun.")
+        elif ctx.author.id in current:
+            await ctx.send("You are already in the tournament.")
         else:
-            await ctx.send("No active duel room found.")
+            current.join(ctx.author, ratings.get(ctx.author.id, elo.initial_rating))
+            await ctx.send(f"{ctx.author.mention} joined the tournament ({len(current)} entrants).")
+    elif action == "leave":
+        if current.started:
+            await ctx.send("The tournament has already begun; use !forfeit in your duels instead.")
+        elif current.leave(ctx.author.id):
+            await ctx.send(f"{ctx.author.mention} left the tournament ({len(current)} entrants).")
+        else:
+            await ctx.send("You are not in the tournament.")
+    elif action == "begin":
+        if current.started:
+            await ctx.send("The tournament has already begun.")
+        elif len(current) < 2:
+            await ctx.send("A tournament needs at least 2 entrants.")
+        else:
+            current.start()
+            current.task = asyncio.create_task(run_tournament(current))
+    elif action == "cancel":
+        current.cancel()
+        if current.task is not None:
+            current.task.cancel()
+        # matches that have not opened a room yet see the flag and never will; the others are
+        # finished as usual (their tasks are not cancelled, which could cut a room lease short)
+        playing = sum(1 for match in current.undecided() if match.session is not None
+                      and get_session(match.session.channel_id) is match.session)
+        del tournaments[ctx.guild.id]
+        message = "The tournament has been cancelled."
+        if playing:
+            message += f" {playing} duel(s) already in progress will be played out as ordinary rated duels."
+        await ctx.send(message)
     else:
+        if not current.started:
+            await ctx.send(f"The tournament is open for entries: {len(current)} so far.")
+            return
+        embed = discord.Embed(title=f"Tournament, round {current.round}", color=discord.Color.gold())
+        playing = [describe_match(match) for match in current.matches if not match.decided]
+        embed.add_field(name="Still playing", value="\n".join(playing[:10]) or "None", inline=False)
+        embed.add_field(name="Standings",
+                        value="\n".join(f"{place}. {entrant.player.mention} ({entrant.score:g})"
+                                        for place, entrant in enumerate(current.standings()[:10], 1)),
+                        inline=False)
+        await ctx.send(embed=embed)
+
+
+@bot.command()
+@metrics.timed("command_seconds", command="extratime")
+async def extratime(ctx, seconds: int = 60, duel_channel: discord.TextChannel = None):
+    """
+    Gives the player to move extra time, or pauses and resumes their clock (Admin)
+    Usage: !extratime [seconds] [#duel-room], !extratime 0 to pause, !extratime -1 to resume
+    """
+    if not ctx.author.guild_permissions.administrator:
         await ctx.send("You need to have the administrator role to use this command.")
+        return
+    channel = duel_channel or ctx.channel
+    if get_session(channel.id) is None:
+        await ctx.send("No active duel in that room.")
+        return
+    if seconds == 0:
+        router.pause(channel.id)
+        await ctx.send("The duel clock is paused.")
+    elif seconds < 0:
+        router.resume(channel.id)
+        await ctx.send("The duel clock is running again.")
+    else:
+        router.extend(channel.id, seconds)
+        await ctx.send(f"Added {seconds} seconds to the duel clock.")
 
 
 @bot.command()
+@metrics.timed("command_seconds", command="forfeit")
 async def forfeit(ctx):
     """
     Forfeit the duel (End the game)
     """
-    global duel_data
-    guild_id = ctx.guild.id
-
-    if guild_id in duel_data:
-        player1 = duel_data[guild_id]["player1"]
-        player2 = duel_data[guild_id]["player2"]
-        duel_channel = duel_data[guild_id]["duel_channel"]
+    session = find_player_session(ctx.author.id)
 
-        if ctx.author not in [player1, player2]:
-            await ctx.send("You are not a participant in this duel.")
-            return
+    if session is not None:
+        player1 = session.player1
+        player2 = session.player2
+        duel_channel = session.channel
 
         await ctx.send("Are you sure you want to forfeit? (y/n)")
 
         def check(message):
-            return message.author == ctx.author and message.content.lower() in ['y', 'n']
+            return message.content.lower() in ['y', 'n']
 
         try:
-            response = await bot.wait_for("message", timeout=30.0, check=check)
+            response = await router.wait(ctx.channel.id, [ctx.author.id], accept=check, timeout=30.0)
+            if response is None:
+                # the duel was stopped while waiting for an answer
+                return
             if response.content.lower() == 'y':
+                if session.game_over:
+                    await ctx.send("This duel is already over.")
+                    return
                 winner = player2 if ctx.author == player1 else player1
-                update_ratings(ratings, winner, ctx.author)
-                await duel_channel.send(
+                if session.game is not None:
+                    action = engine.Action(engine.FORFEIT, session.seat(ctx.author))
+                    session.game, events = engine.apply_action(session.game, action)
+                    session.replay.action(action, events)
+                record_result(winner, ctx.author, forfeit=True)
+                await session.outbox.send(
                     f"{ctx.author.mention} has forfeited the duel. {winner.mention} "
-                    f"wins the match! This channel will be deleted shortly.")
-                del duel_data[guild_id]
-                await asyncio.sleep(15)
-                await duel_channel.delete()
+                    f"wins the match! This room will be closed shortly.")
+                session.phase = "stopped"
+                session.game_over = True
+                close_session(session)
+                router.cancel_channel(duel_channel.id)
+                close_room_later(duel_channel, forfeit_close_delay)
             else:
                 await ctx.send("You decided not to forfeit.")
         except asyncio.TimeoutError:
             await ctx.send("You took too long to respond. The forfeit prompt has timed out.")
     else:
-        await ctx.send("No active duel found for this guild.")
+        await ctx.send("You are not a participant in an active duel.")
 
 
 bot.remove_command("help")
 
 
 @bot.command(name="help")
+@metrics.timed("command_seconds", command="!help")
 async def help(ctx):
     """
     Displays all commands
     """
-    embed = discord.Embed(title="Bot Commands", color=discord.Color.orange())
-
-    for command in bot.commands:
-        command_name = f"**__{command.name}:__**"
-        command_description = command.help
-        embed.add_field(name=command_name, value=command_description, inline=False)
-
+    embed = embed_cache.get("help", command_set_version(), build_help_embed)
     await ctx.send(embed=embed)
 
 
 @bot.command(name="rank")
+@metrics.timed("command_seconds", command="rank")
 async def rank(ctx):
     """
     Check your rating and ranking.
     """
-    global ratings
-
     player_id = ctx.author.id
-    print(player_id)
-
-    # Load ratings
-    ratings = load_ratings()
-    print("Ratings loaded:", ratings)
 
     # checks if the player has a rating
     if player_id not in ratings:
@@ -528,9 +1230,7 @@ async def rank(ctx):
 
     player_rating = round(ratings[player_id])  # Round the player's rating
 
-    # Sort ratings to get the player's rank
-    sorted_ratings = sorted(ratings.items(), key=lambda x: x[1], reverse=True)
-    player_rank = [player[0] for player in sorted_ratings].index(player_id) + 1
+    player_rank = get_player_rank(ctx.author)
 
     # Determine ordinal suffix
     suffix = "th" if 10 <= player_rank % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(player_rank % 10, "th")
@@ -540,3 +1240,25 @@ async def rank(ctx):
     embed.add_field(name="Your Ranking", value=f"{player_rank}{suffix}", inline=False)
 
     await ctx.send(embed=embed)
+
+
+@bot.command(name="leaderboard")
+@metrics.timed("command_seconds", command="leaderboard")
+async def leaderboard(ctx, page: int = 1):
+    """
+    Shows the highest rated players.
+    Usage: !leaderboard [page]
+    """
+    page_count = max(1, -(-len(rank_index) // leaderboard_page_size))
+    page = min(max(page, 1), page_count)
+    entries = rank_index.page((page - 1) * leaderboard_page_size, leaderboard_page_size)
+
+    embed = discord.Embed(title="Leaderboard", color=discord.Color.gold())
+    if entries:
+        embed.description = "\n".join(f"**{player_rank}.** <@{player_id}> - {round(rating)}"
+                                       for player_rank, player_id, rating in entries)
+    else:
+        embed.description = "No one has a rating yet."
+    embed.set_footer(text=f"Page {page}/{page_count}")
+
+    await ctx.send(embed=embed)
@@ -0,0 +1,109 @@
+class DuelSession:
+    """
+    State of a single duel, keyed by the id of its duel channel.
+    """
+    __slots__ = ("guild_id", "channel", "player1", "player2", "phase", "game_over", "players", "seats", "game",
+                 "outbox", "panel", "replay")
+
+    def __init__(self, guild_id, channel, player1, player2):
+        self.guild_id = guild_id
+        self.channel = channel
+        self.player1 = player1
+        self.player2 = player2
+        self.phase = "planning"
+        self.game_over = False
+        self.outbox = None
+        # turn_ui.TurnPanel
+        self.panel = None
+        # replays.ReplayRecorder
+        self.replay = None
+        self.seats = (player1, player2)
+        # engine.GameState once both players have summoned
+        self.game = None
+        self.players = {
+            player1.id: {"phase": "planning", "deck": [], "limbo": [], "health": 20},
+            player2.id: {"phase": "planning", "deck": [], "limbo": [], "health": 20}
+        }
+
+    @property
+    def channel_id(self):
+        return self.channel.id
+
+    def state(self, player):
+        return self.players[player.id]
+
+    def seat(self, player):
+        return 0 if player.id == self.player1.id else 1
+
+    def limbo(self, player):
+        if self.game is None:
+            return self.players[player.id]["limbo"]
+        return self.game.limbos[self.seat(player)]
+
+    def opponent(self, player):
+        return self.player2 if player.id == self.player1.id else self.player1
+
+    def has_player(self, player):
+        return player.id in self.players
+
+
+# channel id -> DuelSession
+duel_sessions = {}
+# player id -> DuelSession, so a player can only be in one duel at a time
+player_sessions = {}
+# stands in for the session of a player whose duel room is still being opened
+_reserved = object()
+
+
+def reserve_players(*players):
+    """
+    Claim players for a duel before its room is open, so no other duel can take them
+    in the meantime. Returns False, claiming no one, if one of them is already dueling.
+    """
+    player_ids = [player.id for player in players if not player.bot]
+    if any(player_id in player_sessions for player_id in player_ids):
+        return False
+    for player_id in player_ids:
+        player_sessions[player_id] = _reserved
+    return True
+
+
+def release_players(*players):
+    """
+    Drop the claims of `reserve_players` for a duel that could not be opened.
+    """
+    for player in players:
+        if player_sessions.get(player.id) is _reserved:
+            del player_sessions[player.id]
+
+
+def in_duel(player_id):
+    return player_id in player_sessions
+
+
+def open_session(guild_id, channel, player1, player2):
+    session = DuelSession(guild_id, channel, player1, player2)
+    duel_sessions[channel.id] = session
+    for player in (player1, player2):
+        # the bot itself can play any number of duels at once
+        if not player.bot:
+            player_sessions[player.id] = session
+    return session
+
+
+def close_session(session):
+    if duel_sessions.get(session.channel_id) is session:
+        del duel_sessions[session.channel_id]
+    for player_id in session.players:
+        if player_sessions.get(player_id) is session:
+            del player_sessions[player_id]
+
+
+def get_session(channel_id):
+    return duel_sessions.get(channel_id)
+
+
+def find_player_session(player_id):
+    session = player_sessions.get(player_id)
+    return None if session is _reserved else session
+
@@ -0,0 +1,27 @@
+"""
+The rating formula, shared by the bot and recompute_ratings.py.
+
+The K-factor depends on how big an upset the result is: K is 32 when the winner
+was rated at or above the loser, 24 when the loser was up to 100 points higher,
+and 16 beyond that.
+"""
+initial_rating = 100
+
+# K-factor for rating differences (loser - winner) up to each threshold, and the last one beyond them
+default_k_factors = (32, 24, 16)
+default_thresholds = (0, 100)
+
+
+def k_factor(rating_difference, k_factors=default_k_factors, thresholds=default_thresholds):
+    for threshold, k in zip(thresholds, k_factors):
+        if rating_difference <= threshold:
+            return k
+    return k_factors[-1]
+
+
+def rate(winner_rating, loser_rating, k):
+    """
+    New (winner, loser) ratings after a win. Works element-wise on NumPy arrays too.
+    """
+    winner_expected = 1 / (1 + 10 ** ((loser_rating - winner_rating) / 400))
+    return winner_rating + k * (1 - winner_expected), loser_rating - k * winner_expected
@@ -0,0 +1,38 @@
+from collections import OrderedDict
+
+
+class EmbedCache:
+    """
+    Embeds built once per version of the data they show.
+
+    `get` rebuilds an embed only when the version passed for its key changes
+    (a card catalog hash, a command set hash, ...). Cached embeds are shared
+    between duels, so callers send them as they are and never modify them.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._embeds = OrderedDict()
+
+    def get(self, key, version, build):
+        entry = self._embeds.get(key)
+        if entry is not None and entry[0] == version:
+            self._embeds.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        embed = build()
+        self._embeds[key] = (version, embed)
+        self._embeds.move_to_end(key)
+        if len(self._embeds) > self.max_size:
+            self._embeds.popitem(last=False)
+        return embed
+
+    def invalidate(self, key):
+        self._embeds.pop(key, None)
+
+    def __len__(self):
+        return len(self._embeds)
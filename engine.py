@@ -0,0 +1,132 @@
+"""
+Battle rules, without any Discord code.
+
+A duel is a GameState that only changes through `apply_action`, which returns the
+next state and the events it produced. States are immutable tuples, so they can be
+kept, compared and replayed freely.
+
+Seats are 0 (the challenger) and 1 (the opponent). Players take turns attacking:
+the attacker picks one of their cards, the defender picks one of theirs, each card
+takes the other's attack as damage, and cards at 0 health or less are defeated.
+A player with no cards left loses; if both run out at once it is a draw.
+"""
+from typing import NamedTuple
+
+ATTACK = "attack"
+DEFEND = "defend"
+FORFEIT = "forfeit"
+OVER = "over"
+
+DRAW = -1
+
+
+class IllegalAction(ValueError):
+    pass
+
+
+class GameState(NamedTuple):
+    limbos: tuple  # (seat 0 cards, seat 1 cards), CardInstance tuples
+    attacker: int
+    phase: str  # ATTACK, DEFEND or OVER
+    attacking_card: object  # identifier of the attacking card while phase is DEFEND
+    exchanges: int
+    winner: object  # seat, DRAW, or None while the game is running
+
+
+class Action(NamedTuple):
+    kind: str  # ATTACK, DEFEND or FORFEIT
+    seat: int
+    card: object = None  # card identifier
+
+
+class Event(NamedTuple):
+    kind: str  # "attack", "defend", "damage", "defeated" or "result"
+    seat: object
+    card: str = None
+    value: int = None
+
+
+def new_game(deck0, deck1):
+    state = GameState((tuple(deck0), tuple(deck1)), 0, ATTACK, None, 0, None)
+    # a player who summoned nothing has already lost
+    return _settle(state)
+
+
+def to_move(state):
+    if state.phase == ATTACK:
+        return state.attacker
+    if state.phase == DEFEND:
+        return 1 - state.attacker
+    return None
+
+
+def legal_actions(state):
+    seat = to_move(state)
+    if seat is None:
+        return []
+    kind = ATTACK if state.phase == ATTACK else DEFEND
+    return [Action(kind, seat, card.identifier) for card in state.limbos[seat]]
+
+
+def find_card(state, seat, identifier):
+    for card in state.limbos[seat]:
+        if card.identifier == identifier:
+            return card
+    return None
+
+
+def apply_action(state, action):
+    if state.phase == OVER:
+        raise IllegalAction("the game is over")
+
+    if action.kind == FORFEIT:
+        winner = 1 - action.seat
+        return state._replace(phase=OVER, attacking_card=None, winner=winner), [Event("result", winner)]
+
+    if action.kind != state.phase or action.seat != to_move(state):
+        raise IllegalAction(f"seat {action.seat} cannot {action.kind} now")
+    card = find_card(state, action.seat, action.card)
+    if card is None:
+        raise IllegalAction(f"seat {action.seat} has no card {action.card!r}")
+
+    if action.kind == ATTACK:
+        return state._replace(phase=DEFEND, attacking_card=card.identifier), [Event("attack", action.seat, card.name)]
+
+    attacker_seat = state.attacker
+    defender_seat = action.seat
+    attacker_card = find_card(state, attacker_seat, state.attacking_card)
+    defender_card = card
+
+    damaged_attacker_card = attacker_card._replace(health=attacker_card.health - defender_card.attack)
+    damaged_defender_card = defender_card._replace(health=defender_card.health - attacker_card.attack)
+
+    events = [
+        Event("defend", defender_seat, defender_card.name),
+        Event("damage", defender_seat, defender_card.name, attacker_card.attack),
+        Event("damage", attacker_seat, attacker_card.name, defender_card.attack),
+    ]
+
+    limbos = list(state.limbos)
+    for seat, damaged in ((attacker_seat, damaged_attacker_card), (defender_seat, damaged_defender_card)):
+        if damaged.health <= 0:
+            events.append(Event("defeated", seat, damaged.name))
+            limbos[seat] = tuple(c for c in limbos[seat] if c.identifier != damaged.identifier)
+        else:
+            limbos[seat] = tuple(damaged if c.identifier == damaged.identifier else c for c in limbos[seat])
+
+    state = GameState(tuple(limbos), defender_seat, ATTACK, None, state.exchanges + 1, None)
+    state = _settle(state)
+    if state.phase == OVER:
+        events.append(Event("result", state.winner))
+    return state, events
+
+
+def _settle(state):
+    limbo0, limbo1 = state.limbos
+    if limbo0 and limbo1:
+        return state
+    if not limbo0 and not limbo1:
+        winner = DRAW
+    else:
+        winner = 0 if limbo0 else 1
+    return state._replace(phase=OVER, attacking_card=None, winner=winner)
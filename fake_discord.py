@@ -0,0 +1,210 @@
+"""
+In-process stand-ins for the Discord objects the duel code talks to.
+
+They behave just enough like discord.py's Guild, Member, TextChannel, Thread and
+Message for a whole duel to run without a gateway connection. Every method that
+would be a REST call is counted in `FakeAPI.calls` and can be given a latency.
+"""
+import asyncio
+import itertools
+from collections import Counter
+
+_ids = itertools.count(10 ** 17)
+
+
+class FakeAPI:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.listeners = []
+
+    async def call(self, route):
+        self.calls[route] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+
+class FakePermissions:
+    def __init__(self, administrator=False):
+        self.administrator = administrator
+
+
+class FakeRole:
+    def __init__(self, guild, name="@everyone"):
+        self.id = guild.id
+        self.name = name
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMember:
+    def __init__(self, guild, name, administrator=False):
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.bot = False
+        self.guild_permissions = FakePermissions(administrator)
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeMember) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"<FakeMember {self.name}>"
+
+
+class FakeMessage:
+    def __init__(self, api, channel, author, content=None, embeds=()):
+        self.id = next(_ids)
+        self.api = api
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content or ""
+        self.embeds = list(embeds)
+
+    async def edit(self, content=None, embed=None, embeds=None, view=None):
+        await self.api.call("PATCH /channels/{channel_id}/messages/{message_id}")
+        if content is not None:
+            self.content = content
+        for listener in self.api.listeners:
+            listener(self)
+        return self
+
+
+class FakeTextChannel:
+    def __init__(self, api, guild, name, overwrites=None):
+        self.id = next(_ids)
+        self.api = api
+        self.guild = guild
+        self.name = name
+        self.overwrites = dict(overwrites or {})
+        self.messages = 0
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, embed=None, embeds=None, view=None):
+        await self.api.call("POST /channels/{channel_id}/messages")
+        embeds = list(embeds or ()) + ([embed] if embed is not None else [])
+        message = FakeMessage(self.api, self, self.guild.me, content, embeds)
+        self.messages += 1
+        for listener in self.api.listeners:
+            listener(message)
+        return message
+
+    async def edit(self, overwrites=None, archived=None, locked=None, **kwargs):
+        await self.api.call("PATCH /channels/{channel_id}")
+        if overwrites is not None:
+            self.overwrites = dict(overwrites)
+
+    async def delete(self):
+        await self.api.call("DELETE /channels/{channel_id}")
+        self.guild.channels.remove(self)
+
+    async def purge(self, limit=100, **kwargs):
+        # one history page and one bulk delete per 100 messages
+        deleted = self.messages if limit is None else min(limit, self.messages)
+        for _ in range(0, max(deleted, 1), 100):
+            await self.api.call("GET /channels/{channel_id}/messages")
+            if deleted:
+                await self.api.call("POST /channels/{channel_id}/messages/bulk-delete")
+        self.messages -= deleted
+        return [None] * deleted
+
+    async def create_thread(self, name, type=None, invitable=True):
+        await self.api.call("POST /channels/{channel_id}/threads")
+        return FakeThread(self.api, self.guild, name, self)
+
+    def __eq__(self, other):
+        return isinstance(other, FakeTextChannel) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeThread(FakeTextChannel):
+    def __init__(self, api, guild, name, parent):
+        super().__init__(api, guild, name)
+        self.parent = parent
+
+    async def add_user(self, user):
+        await self.api.call("PUT /channels/{channel_id}/thread-members/{user_id}")
+
+
+class FakeGuild:
+    def __init__(self, api, name="guild"):
+        self.id = next(_ids)
+        self.api = api
+        self.name = name
+        self.default_role = FakeRole(self)
+        self.me = FakeMember(self, "Deckwars")
+        self.me.bot = True
+        self.channels = []
+        self._members = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def add_member(self, name, administrator=False):
+        member = FakeMember(self, name, administrator)
+        self._members[member.id] = member
+        return member
+
+    def add_text_channel(self, name):
+        channel = FakeTextChannel(self.api, self, name)
+        self.channels.append(channel)
+        return channel
+
+    async def create_text_channel(self, name, overwrites=None):
+        await self.api.call("POST /guilds/{guild_id}/channels")
+        channel = FakeTextChannel(self.api, self, name, overwrites)
+        self.channels.append(channel)
+        return channel
+
+    @property
+    def text_channels(self):
+        return list(self.channels)
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_channel(self, channel_id):
+        return next((channel for channel in self.channels if channel.id == channel_id), None)
+
+
+class FakeContext:
+    """
+    The parts of commands.Context a command handler uses.
+    """
+
+    def __init__(self, api, guild, channel, author):
+        self.api = api
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+
+    async def send(self, content=None, embed=None, embeds=None, view=None):
+        return await self.channel.send(content=content, embed=embed, embeds=embeds, view=view)
+
+
+def user_message(channel, author, content):
+    """
+    A message as it would arrive from the gateway, for dispatching to the bot.
+    """
+    return FakeMessage(channel.api, channel, author, content)
+
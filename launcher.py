@@ -0,0 +1,107 @@
+"""
+Run the bot as several worker processes, each with its own share of the shards.
+
+One process handles every guild on one event loop; past a few thousand guilds
+that loop falls behind. Each worker here is a bot.py process that runs a
+contiguous range of shards. The workers share the ratings through ratings.db
+(SQLite) and keep everything else to themselves. A worker that crashes is
+restarted with the same shards; one that exits cleanly is not, and one stopped
+with /shutdown stops every other worker too.
+
+Usage: python launcher.py [--workers 2] [--shard-count N] [--sync]
+
+Without --shard-count the number Discord recommends is used. Keep the worker and
+shard counts the same across restarts so duels resume in the worker that saved them.
+"""
+import argparse
+import asyncio
+import signal
+import sys
+
+# Discord lets a bot identify one shard every five seconds (more for very large bots)
+identify_interval = 5.0
+restart_delay = 5.0
+# exit status of a worker stopped with /shutdown (see bot.py)
+shutdown_exit_code = 3
+
+
+async def recommended_shard_count():
+    import discord
+    from BotToken import BotToken
+
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(BotToken)
+        shard_count, _, _ = await http.get_bot_gateway()
+        return shard_count
+    finally:
+        await http.close()
+
+
+def split_shards(shard_count, workers):
+    """
+    Shard ids for each worker, as contiguous ranges of near-equal size.
+    """
+    return [list(range(shard_count * worker // workers, shard_count * (worker + 1) // workers))
+            for worker in range(workers)]
+
+
+def stop_workers(processes, stopping):
+    stopping.set()
+    for process in processes.values():
+        if process.returncode is None and sys.platform == "win32":
+            process.terminate()
+        elif process.returncode is None:
+            # an interrupted bot closes its connections and keeps its duels' checkpoints
+            process.send_signal(signal.SIGINT)
+
+
+async def run_worker(worker, shard_ids, shard_count, sync, processes, stopping):
+    arguments = [sys.executable, "bot.py", "--worker", str(worker), "--shards", ",".join(map(str, shard_ids)),
+                 "--shard-count", str(shard_count)]
+    if sync and worker == 0:
+        arguments.append("--sync")
+    while not stopping.is_set():
+        process = await asyncio.create_subprocess_exec(*arguments)
+        processes[worker] = process
+        print(f"worker {worker} (shards {shard_ids[0]}-{shard_ids[-1]}) started, pid {process.pid}")
+        code = await process.wait()
+        if code == shutdown_exit_code:
+            print(f"worker {worker} was shut down, stopping every worker")
+            stop_workers(processes, stopping)
+            return
+        if code == 0 or stopping.is_set():
+            print(f"worker {worker} exited")
+            return
+        print(f"worker {worker} exited with {code}, restarting in {restart_delay}s")
+        await asyncio.sleep(restart_delay)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run the bot as several shard worker processes.")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--shard-count", type=int, help="total shards; defaults to Discord's recommendation")
+    parser.add_argument("--sync", action="store_true", help="push the slash commands even if they look unchanged")
+    args = parser.parse_args()
+
+    shard_count = args.shard_count or await recommended_shard_count()
+    workers = min(args.workers, shard_count)
+    print(f"running {shard_count} shards in {workers} workers")
+
+    processes = {}
+    stopping = asyncio.Event()
+    tasks = []
+    for worker, shard_ids in enumerate(split_shards(shard_count, workers)):
+        if stopping.is_set():
+            break
+        tasks.append(asyncio.create_task(run_worker(worker, shard_ids, shard_count, args.sync, processes, stopping)))
+        # let this worker's shards identify before the next worker starts
+        await asyncio.sleep(identify_interval * len(shard_ids))
+    await asyncio.gather(*tasks)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,182 @@
+from bisect import bisect_left, insort
+from itertools import islice
+
+
+class SortedList:
+    """
+    Sorted sequence kept as a list of short sorted sublists.
+
+    A Fenwick tree over the sublist lengths turns "position of value" and
+    "value at position" into O(log n) lookups; inserts and removals only shift
+    one sublist.
+    """
+    load = 256
+
+    def __init__(self, iterable=()):
+        values = sorted(iterable)
+        self._lists = [values[i:i + self.load] for i in range(0, len(values), self.load)]
+        self._maxes = [sublist[-1] for sublist in self._lists]
+        self._len = len(values)
+        self._build_tree()
+
+    def _build_tree(self):
+        tree = [0] * (len(self._lists) + 1)
+        for i, sublist in enumerate(self._lists, 1):
+            tree[i] += len(sublist)
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, sublist_index, delta):
+        i = sublist_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _offset(self, sublist_index):
+        # number of values stored before the given sublist
+        total = 0
+        i = sublist_index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, index):
+        # sublist holding the value at `index`, and the value's offset inside it
+        position = 0
+        bit = 1 << (len(self._tree) - 1).bit_length()
+        while bit:
+            nxt = position + bit
+            if nxt < len(self._tree) and self._tree[nxt] <= index:
+                index -= self._tree[nxt]
+                position = nxt
+            bit >>= 1
+        return position, index
+
+    def add(self, value):
+        if not self._lists:
+            self._lists.append([value])
+            self._maxes.append(value)
+            self._len = 1
+            self._build_tree()
+            return
+
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            i -= 1
+        sublist = self._lists[i]
+        insort(sublist, value)
+        self._maxes[i] = sublist[-1]
+        self._len += 1
+
+        if len(sublist) > 2 * self.load:
+            self._lists[i:i + 1] = [sublist[:self.load], sublist[self.load:]]
+            self._maxes[i:i + 1] = [sublist[self.load - 1], sublist[-1]]
+            self._build_tree()
+        else:
+            self._tree_add(i, 1)
+
+    def remove(self, value):
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            raise ValueError(f"{value!r} not in list")
+        sublist = self._lists[i]
+        j = bisect_left(sublist, value)
+        if sublist[j] != value:
+            raise ValueError(f"{value!r} not in list")
+
+        del sublist[j]
+        self._len -= 1
+        if sublist:
+            self._maxes[i] = sublist[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+            self._build_tree()
+
+    def bisect_left(self, value):
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            return self._len
+        return self._offset(i) + bisect_left(self._lists[i], value)
+
+    def index(self, value):
+        position = self.bisect_left(value)
+        if position == self._len or self[position] != value:
+            raise ValueError(f"{value!r} not in list")
+        return position
+
+    def islice(self, start=0, stop=None):
+        stop = self._len if stop is None else min(stop, self._len)
+        if start >= stop:
+            return
+        i, j = self._locate(start)
+        remaining = stop - start
+        for sublist in islice(self._lists, i, None):
+            for value in islice(sublist, j, j + remaining):
+                yield value
+                remaining -= 1
+            if not remaining:
+                return
+            j = 0
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("list index out of range")
+        i, j = self._locate(index)
+        return self._lists[i][j]
+
+    def __contains__(self, value):
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            return False
+        sublist = self._lists[i]
+        return sublist[bisect_left(sublist, value)] == value
+
+    def __iter__(self):
+        for sublist in self._lists:
+            yield from sublist
+
+    def __len__(self):
+        return self._len
+
+
+class RankIndex:
+    """
+    Leaderboard order of all rated players: highest rating first, ties by player id.
+    """
+
+    def __init__(self, ratings=()):
+        self._ratings = dict(ratings)
+        self._order = SortedList((-rating, player_id) for player_id, rating in self._ratings.items())
+
+    def update(self, player_id, rating):
+        old_rating = self._ratings.get(player_id)
+        if old_rating is not None:
+            self._order.remove((-old_rating, player_id))
+        self._ratings[player_id] = rating
+        self._order.add((-rating, player_id))
+
+    def rank(self, player_id):
+        """
+        1-based rank of the player, or None if they have no rating.
+        """
+        rating = self._ratings.get(player_id)
+        if rating is None:
+            return None
+        return self._order.index((-rating, player_id)) + 1
+
+    def page(self, start, count):
+        """
+        `count` entries starting at 0-based position `start`, as (rank, player_id, rating).
+        """
+        return [(rank, player_id, -negated_rating) for rank, (negated_rating, player_id)
+                in enumerate(self._order.islice(start, start + count), start + 1)]
+
+    def __len__(self):
+        return len(self._order)
@@ -0,0 +1,44 @@
+import struct
+import time
+
+# one finished duel: unix time, winner id, loser id, flags
+record = struct.Struct("<dQQB")
+
+# flags; for a draw "winner" and "loser" are just the two seats
+DRAW = 1
+FORFEIT = 2
+
+
+class MatchHistory:
+    """
+    Append-only log of every finished duel, 25 bytes per match.
+
+    Each record is a single write in append mode, so after a crash the file ends
+    in at most one torn record. Readers drop it, and the first append of the next
+    process cuts it off, so the records after it stay aligned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._aligned = False
+
+    def append(self, winner_id, loser_id, flags=0, timestamp=None):
+        data = record.pack(time.time() if timestamp is None else timestamp, winner_id, loser_id, flags)
+        with open(self.path, "ab") as f:
+            if not self._aligned:
+                size = f.seek(0, 2)
+                if size % record.size:
+                    f.truncate(size - size % record.size)
+                self._aligned = True
+            f.write(data)
+
+    def __iter__(self):
+        """
+        (time, winner id, loser id, flags) of every complete record, oldest first.
+        """
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return iter(())
+        return record.iter_unpack(data[:len(data) - len(data) % record.size])
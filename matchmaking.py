@@ -0,0 +1,160 @@
+import time
+
+from leaderboard import SortedList
+
+# rating difference accepted right after joining, how fast it grows per second waited, and its cap
+base_window = 50
+widen_rate = 5
+max_window = 400
+
+
+class Ticket:
+    __slots__ = ("player", "channel", "rating", "joined_at")
+
+    def __init__(self, player, channel, rating, joined_at):
+        self.player = player
+        # where the player queued, for announcing the match
+        self.channel = channel
+        self.rating = rating
+        self.joined_at = joined_at
+
+    @property
+    def key(self):
+        return self.rating, self.player.id
+
+    def window(self, now):
+        return min(max_window, base_window + widen_rate * (now - self.joined_at))
+
+
+class MatchQueue:
+    """
+    Players of one guild waiting for an opponent, ordered by rating.
+
+    The nearest-rated opponents of a player are their two neighbours in the sorted
+    order, so looking for a match is a single O(log n) bisect. Two players are
+    matched when their rating difference fits in both of their windows, which
+    widen the longer each of them waits.
+    """
+
+    def __init__(self):
+        self._order = SortedList()
+        # player id -> Ticket, oldest first
+        self._tickets = {}
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def __contains__(self, player_id):
+        return player_id in self._tickets
+
+    def join(self, player, channel, rating, now):
+        ticket = Ticket(player, channel, rating, now)
+        self._tickets[player.id] = ticket
+        self._order.add(ticket.key)
+        return ticket
+
+    def leave(self, player_id):
+        ticket = self._tickets.pop(player_id, None)
+        if ticket is not None:
+            self._order.remove(ticket.key)
+        return ticket
+
+    def match(self, ticket, now):
+        """
+        Take the nearest-rated acceptable opponent for a queued player out of the queue, with the player.
+        """
+        position = self._order.bisect_left(ticket.key)
+        best = None
+        for neighbour in (position - 1, position + 1):
+            if not 0 <= neighbour < len(self._order):
+                continue
+            other = self._tickets[self._order[neighbour][1]]
+            difference = abs(other.rating - ticket.rating)
+            if difference > min(ticket.window(now), other.window(now)):
+                continue
+            if best is None or difference < abs(best.rating - ticket.rating):
+                best = other
+        if best is not None:
+            self.leave(ticket.player.id)
+            self.leave(best.player.id)
+        return best
+
+    def pair(self, now):
+        """
+        Match everyone who can be matched now, longest waiting first.
+        """
+        pairs = []
+        for ticket in list(self._tickets.values()):
+            if ticket.player.id not in self._tickets:
+                # already matched by someone who waited longer
+                continue
+            opponent = self.match(ticket, now)
+            if opponent is not None:
+                pairs.append((ticket, opponent))
+        return pairs
+
+
+class Matchmaker:
+    """
+    One MatchQueue per guild, since both players of a duel need to be in the guild of its room.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        # player id -> guild id
+        self._guilds = {}
+
+    def __len__(self):
+        return len(self._guilds)
+
+    def __contains__(self, player_id):
+        return player_id in self._guilds
+
+    def join(self, player, channel, rating, now=None):
+        """
+        Queue the player and match them right away if someone close enough is waiting.
+        Returns the (ticket, opponent) pair, or None if the player is left waiting.
+        """
+        now = time.monotonic() if now is None else now
+        guild_id = player.guild.id
+        queue = self._queues.get(guild_id)
+        if queue is None:
+            queue = self._queues[guild_id] = MatchQueue()
+        ticket = queue.join(player, channel, rating, now)
+        self._guilds[player.id] = guild_id
+
+        opponent = queue.match(ticket, now)
+        if opponent is None:
+            return None
+        self._forget(ticket, opponent)
+        if not queue:
+            del self._queues[guild_id]
+        return ticket, opponent
+
+    def leave(self, player_id):
+        guild_id = self._guilds.pop(player_id, None)
+        if guild_id is None:
+            return None
+        queue = self._queues[guild_id]
+        ticket = queue.leave(player_id)
+        if not queue:
+            del self._queues[guild_id]
+        return ticket
+
+    def tick(self, now=None):
+        """
+        Match the players whose windows have widened enough since the last tick, in every guild.
+        """
+        now = time.monotonic() if now is None else now
+        pairs = []
+        for guild_id, queue in list(self._queues.items()):
+            for ticket, opponent in queue.pair(now):
+                self._forget(ticket, opponent)
+                pairs.append((ticket, opponent))
+            if not queue:
+                del self._queues[guild_id]
+        return pairs
+
+    def _forget(self, ticket, opponent):
+        del self._guilds[ticket.player.id]
+        del self._guilds[opponent.player.id]
@@ -0,0 +1,243 @@
+import asyncio
+import functools
+from bisect import bisect_left
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+prefix = "deckwars_"
+
+# upper bounds in seconds, from half a millisecond to two minutes
+default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   60.0, 120.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets=default_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, fraction):
+        """
+        Upper bound of the bucket holding the given fraction of observations.
+        """
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Counters, histograms and gauges, readable by /stats and exported in Prometheus text format.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def observe(self, name, value, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    def gauge(self, name, read):
+        """
+        Report `read()` as the gauge's value whenever metrics are read.
+        """
+        self.gauges[name] = read
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        """
+        Decorator recording how long each call of a function or coroutine function takes.
+        """
+        histogram = self.histogram(name, **labels)
+
+        def decorator(function):
+            if asyncio.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        histogram.observe(time.perf_counter() - start)
+            else:
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return function(*args, **kwargs)
+                    finally:
+                        histogram.observe(time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def render(self):
+        lines = []
+        for (name, labels), value in sorted(self.counters.items()):
+            lines.append(f"{prefix}{name}_total{_labels(labels)} {value}")
+        for name, read in sorted(self.gauges.items()):
+            lines.append(f"{prefix}{name} {read()}")
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{prefix}{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{prefix}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{prefix}{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{prefix}{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics = Metrics()
+
+
+def instrument_http(http):
+    """
+    Time every REST call discord.py makes, by wrapping its single request method.
+    """
+    request = http.request
+
+    async def timed_request(route, **kwargs):
+        label = f"{route.method} {route.path}"
+        start = time.perf_counter()
+        try:
+            return await request(route, **kwargs)
+        except Exception:
+            metrics.inc("discord_api_errors", route=label)
+            raise
+        finally:
+            metrics.observe("discord_api_seconds", time.perf_counter() - start, route=label)
+
+    http.request = timed_request
+
+
+async def monitor_loop_lag(interval=0.5):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.observe("event_loop_lag_seconds", time.perf_counter() - start - interval)
+
+
+async def export_to_file(path, interval=15.0):
+    while True:
+        await asyncio.sleep(interval)
+        text = metrics.render()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+async def serve(port, host="127.0.0.1"):
+    """
+    Serve the metrics over HTTP for Prometheus to scrape.
+    """
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = metrics.render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+class SamplingProfiler:
+    """
+    Samples the event loop thread's stack every `interval` seconds from a background
+    thread, to see what slow turns spend their time on.
+    """
+
+    def __init__(self, interval=0.005, depth=8):
+        self.interval = interval
+        self.depth = depth
+        self.samples = Counter()
+        self._thread = None
+        self._stop = threading.Event()
+        self._target = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._target = threading.get_ident()
+        self._stop.clear()
+        self.samples.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None and len(stack) < self.depth:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} {code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(stack)] += 1
+
+    def top(self, count=10):
+        total = sum(self.samples.values())
+        return [(stack, samples / total) for stack, samples in self.samples.most_common(count)]
+
+
+profiler = SamplingProfiler()
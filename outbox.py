@@ -0,0 +1,193 @@
+import asyncio
+import functools
+import time
+
+import discord
+
+from metrics import metrics
+
+# Discord limits for a single message
+max_content_length = 2000
+max_embeds = 10
+max_embed_length = 6000
+
+# Discord's per-channel message bucket
+bucket_rate = 5
+bucket_per = 5.0
+
+flush_timer = functools.partial(metrics.timer, "outbox_flush_seconds")
+
+# totals over every outbox, for reporting
+totals = {"queued": 0, "calls": 0}
+
+
+class TokenBucket:
+    """
+    Client-side copy of Discord's per-channel message bucket (5 messages per 5 seconds),
+    so batches are spaced out instead of running into 429 responses.
+    """
+
+    def __init__(self, rate=None, per=None):
+        self.rate = rate or bucket_rate
+        self.per = per or bucket_per
+        self.tokens = float(self.rate)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate / self.per)
+        self.updated = now
+
+    async def acquire(self):
+        self._refill()
+        while self.tokens < 1:
+            await asyncio.sleep((1 - self.tokens) * self.per / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+class ChannelOutbox:
+    """
+    Outgoing messages for one duel channel.
+
+    Everything queued within `window` seconds is sent as a few combined messages
+    (text lines joined, up to 10 embeds each). Battle log lines are added to one
+    "battle log" message by editing it, as long as nothing else has been posted
+    below it. Call `flush` before waiting for a player so they see their prompt.
+    """
+
+    def __init__(self, channel, window=0.25, bucket=None):
+        self.channel = channel
+        self.window = window
+        self.bucket = bucket or TokenBucket()
+        self.queued = 0
+        self.calls = 0
+        self._pending = []
+        self._timer = None
+        # flushes started by the timer; the loop only keeps weak references to tasks
+        self._flush_tasks = set()
+        self._lock = asyncio.Lock()
+        self._last_message = None
+        self._log_message = None
+        self._log_lines = []
+
+    @property
+    def saved(self):
+        return self.queued - self.calls
+
+    def queue(self, content=None, embed=None):
+        if content is not None:
+            self._add(("text", content))
+        if embed is not None:
+            self._add(("embed", embed))
+
+    def log(self, line):
+        self._add(("log", line))
+
+    def _add(self, item):
+        self._pending.append(item)
+        self.queued += 1
+        totals["queued"] += 1
+        if self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush_later)
+
+    def _flush_later(self):
+        self._timer = None
+        task = asyncio.create_task(self._flush_quietly())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush_quietly(self):
+        try:
+            await self.flush()
+        except discord.HTTPException as e:
+            # the channel is most likely gone already
+            print(f"could not flush outbox for {self.channel.id}: {e}")
+        except Exception as e:
+            print(f"outbox flush for {self.channel.id} failed: {e!r}")
+
+    async def send(self, content=None, embed=None):
+        self.queue(content, embed)
+        await self.flush()
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._lock:
+            with flush_timer():
+                pending, self._pending = self._pending, []
+                lines = []
+                embeds = []
+                log_lines = []
+
+                for kind, payload in pending:
+                    if kind == "log":
+                        if lines or embeds:
+                            await self._post(lines, embeds)
+                            lines, embeds = [], []
+                        log_lines.append(payload)
+                        continue
+
+                    if log_lines:
+                        await self._write_log(log_lines)
+                        log_lines = []
+
+                    if kind == "text":
+                        if lines and len("\n".join(lines + [payload])) > max_content_length:
+                            await self._post(lines, embeds)
+                            lines, embeds = [], []
+                        lines.append(payload)
+                    else:
+                        if embeds and (len(embeds) == max_embeds
+                                       or sum(map(len, embeds)) + len(payload) > max_embed_length):
+                            await self._post(lines, embeds)
+                            lines, embeds = [], []
+                        embeds.append(payload)
+
+                if log_lines:
+                    await self._write_log(log_lines)
+                if lines or embeds:
+                    await self._post(lines, embeds)
+
+    async def post(self, content=None, embed=None, view=None):
+        """
+        Send a message right away, after everything queued, e.g. one with components.
+        """
+        await self.flush()
+        await self._call()
+        self._last_message = await self.channel.send(content=content, embed=embed, view=view)
+        return self._last_message
+
+    async def edit(self, message, **fields):
+        await self._call()
+        await message.edit(**fields)
+
+    async def _post(self, lines, embeds):
+        await self._call()
+        self._last_message = await self.channel.send(content="\n".join(lines) or None, embeds=embeds)
+
+    async def _write_log(self, new_lines):
+        if self._log_message is not None and self._log_message is self._last_message:
+            content = "\n".join(self._log_lines + new_lines)
+            if len(content) <= max_content_length:
+                await self._call()
+                await self._log_message.edit(content=content)
+                self._log_lines.extend(new_lines)
+                return
+
+        await self._call()
+        self._log_lines = list(new_lines)
+        self._log_message = self._last_message = await self.channel.send("\n".join(self._log_lines))
+
+    async def _call(self):
+        await self.bucket.acquire()
+        self.calls += 1
+        totals["calls"] += 1
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._pending.clear()
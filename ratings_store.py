@@ -0,0 +1,321 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+from metrics import metrics
+from writer import BatchWriter
+
+
+class RatingsStore:
+    """
+    Player ratings kept in memory, with every change appended to a journal file.
+
+    Reads never touch the disk. Writes only queue a journal record; a background
+    thread appends the records and, every `compact_every` records, folds the journal
+    into the snapshot file (`ratings.json`). At startup the snapshot is loaded and
+    the journal replayed on top of it, so a crash loses at most the records that
+    were still queued.
+    """
+
+    writer_name = "ratings-journal"
+
+    def __init__(self, path, journal_path=None, compact_every=1000, load=True):
+        self.path = path
+        self.journal_path = journal_path or f"{path}.journal"
+        self.compact_every = compact_every
+        self._ratings = {}
+        self._listeners = []
+        self._writer = BatchWriter(self.writer_name, self._write_batch, start=self._open_writer,
+                                   finish=self._close_writer)
+        self._journal = None
+        self._journaled = 0
+        if load:
+            self.recover()
+
+    # mapping interface, so the store can be used like the old ratings dict
+    def __contains__(self, player_id):
+        return player_id in self._ratings
+
+    def __getitem__(self, player_id):
+        return self._ratings[player_id]
+
+    def __setitem__(self, player_id, rating):
+        self._apply(player_id, rating)
+        self._writer.put((player_id, rating))
+
+    def _apply(self, player_id, rating):
+        self._ratings[player_id] = rating
+        for listener in self._listeners:
+            listener(player_id, rating)
+
+    def __iter__(self):
+        return iter(self._ratings)
+
+    def __len__(self):
+        return len(self._ratings)
+
+    def get(self, player_id, default=None):
+        return self._ratings.get(player_id, default)
+
+    def items(self):
+        return self._ratings.items()
+
+    def setdefault(self, player_id, rating):
+        if player_id not in self._ratings:
+            self[player_id] = rating
+        return self._ratings[player_id]
+
+    def update_pair(self, winner_id, loser_id, rate, default):
+        """
+        Rate a finished duel: `rate(winner rating, loser rating)` returns both new ratings.
+        """
+        self[winner_id], self[loser_id] = rate(self.get(winner_id, default), self.get(loser_id, default))
+
+    def subscribe(self, listener):
+        """
+        Call `listener(player_id, rating)` after every rating change.
+        """
+        self._listeners.append(listener)
+
+    # startup recovery
+    @metrics.timed("ratings_load_seconds")
+    def recover(self):
+        try:
+            with open(self.path, "r") as f:
+                self._ratings = {int(key): value for key, value in json.load(f).items()}
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._ratings = {}
+
+        replayed = 0
+        try:
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        player_id, rating = json.loads(line)
+                    except (ValueError, TypeError):
+                        # torn write from a crash, everything after it is lost anyway
+                        break
+                    self._ratings[int(player_id)] = rating
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+
+        if replayed:
+            self._compact()
+
+    # journal writer, run on the writer thread
+    def _open_writer(self):
+        self._journal = open(self.journal_path, "a")
+
+    def _write_batch(self, records):
+        if records:
+            start = time.perf_counter()
+            self._journal.writelines(json.dumps(record) + "\n" for record in records)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._journaled += len(records)
+            metrics.observe("ratings_save_seconds", time.perf_counter() - start)
+        if self._journaled >= self.compact_every:
+            self._fold_journal()
+
+    def _close_writer(self):
+        if self._journaled:
+            self._fold_journal()
+        self._journal.close()
+
+    def _fold_journal(self):
+        self._compact()
+        self._journal.seek(0)
+        self._journal.truncate()
+
+    @metrics.timed("ratings_compact_seconds")
+    def _compact(self):
+        # dict.copy() is atomic, so this is safe while the event loop keeps writing;
+        # records newer than the copy are still in the queue and will be journaled again
+        snapshot = self._ratings.copy()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        if not self._writer.started:
+            open(self.journal_path, "w").close()
+        self._journaled = 0
+
+    def flush(self, timeout=None):
+        """
+        Block until every queued change is in the journal.
+        """
+        self._writer.flush(timeout)
+
+    def close(self):
+        self._writer.close()
+
+
+class SharedRatingsStore(RatingsStore):
+    """
+    Player ratings in a SQLite database that several bot processes share.
+
+    Each process keeps its own in-memory copy, so reads still never touch the
+    disk. A background thread writes changes in batched transactions, both to the
+    ratings table and to a change log. Every process polls the log with `watch()`
+    and applies what was committed, so their leaderboards stay current. The
+    database runs in WAL mode, so pollers never block the writers.
+
+    A player can be in a duel on each of several processes at once, and a process's
+    copy can be a poll interval behind. So `update_pair` only estimates the new
+    ratings in memory; the writer redoes the calculation from the database rows in
+    a BEGIN IMMEDIATE transaction, and the committed ratings reach every process's
+    copy, this one's included, through the change log. `setdefault` never
+    overwrites a rating another process already stored.
+    """
+
+    writer_name = "ratings-db"
+
+    def __init__(self, path, import_from=None, keep_changes=100000, load=True):
+        self.import_from = import_from
+        self.keep_changes = keep_changes
+        # which process wrote a change, for looking into the log
+        self.writer_id = os.getpid()
+        self._seen = 0
+        self._reader = None
+        self._connection = None
+        self._written = 0
+        super().__init__(path, load=load)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("CREATE TABLE IF NOT EXISTS ratings (player_id INTEGER PRIMARY KEY, rating REAL NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                           "player_id INTEGER NOT NULL, rating REAL NOT NULL, writer INTEGER NOT NULL)")
+        return connection
+
+    @metrics.timed("ratings_load_seconds")
+    def recover(self):
+        if self._reader is None:
+            self._reader = self._connect()
+        with self._reader:
+            # read both in one transaction, so no change falls between them
+            self._reader.execute("BEGIN")
+            self._ratings = dict(self._reader.execute("SELECT player_id, rating FROM ratings"))
+            self._seen = self._reader.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+        if not self._ratings and self.import_from:
+            # first start on SQLite: take over the single-process store's ratings
+            old = RatingsStore(self.import_from)
+            old.close()
+            if len(old):
+                with self._reader:
+                    self._reader.executemany("INSERT OR IGNORE INTO ratings VALUES (?, ?)", old.items())
+                self._ratings = dict(old.items())
+                print(f"imported {len(old)} ratings from {self.import_from}")
+
+    def fetch_changes(self):
+        """
+        Ratings committed by any process since the last call. Safe to call from a thread.
+        """
+        rows = self._reader.execute("SELECT seq, player_id, rating FROM changes WHERE seq > ? ORDER BY seq",
+                                    (self._seen,)).fetchall()
+        if rows:
+            self._seen = rows[-1][0]
+        return [(player_id, rating) for _, player_id, rating in rows]
+
+    def apply_changes(self, changes):
+        for player_id, rating in changes:
+            self._apply(player_id, rating)
+
+    # writes: applied to the in-memory copy now, to the database by the writer thread
+    def __setitem__(self, player_id, rating):
+        self._apply(player_id, rating)
+        self._writer.put(("set", player_id, rating))
+
+    def setdefault(self, player_id, rating):
+        if player_id not in self._ratings:
+            self._apply(player_id, rating)
+            self._writer.put(("default", player_id, rating))
+        return self._ratings[player_id]
+
+    def update_pair(self, winner_id, loser_id, rate, default):
+        winner_rating, loser_rating = rate(self.get(winner_id, default), self.get(loser_id, default))
+        self._apply(winner_id, winner_rating)
+        self._apply(loser_id, loser_rating)
+        self._writer.put(("pair", winner_id, loser_id, rate, default))
+
+    async def watch(self, interval=1.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                changes = await asyncio.to_thread(self.fetch_changes)
+            except sqlite3.Error as e:
+                print(f"could not read rating changes from {self.path}: {e}")
+                continue
+            self.apply_changes(changes)
+
+    # database writer, run on the writer thread
+    def _open_writer(self):
+        self._connection = self._connect()
+        # transactions are begun and committed by _commit
+        self._connection.isolation_level = None
+        self._written = 0
+
+    def _close_writer(self):
+        self._connection.close()
+
+    def _commit(self, connection, records):
+        """
+        Apply queued writes in one transaction that holds the write lock from the first read,
+        so no other process changes a rating between reading and rewriting it.
+        """
+        changes = []
+        connection.execute("BEGIN IMMEDIATE")
+        for record in records:
+            kind = record[0]
+            if kind == "default":
+                if connection.execute("INSERT OR IGNORE INTO ratings VALUES (?, ?)", record[1:]).rowcount:
+                    changes.append(record[1:])
+                continue
+            if kind == "set":
+                rows = [record[1:]]
+            else:
+                _, winner_id, loser_id, rate, default = record
+                current = dict(connection.execute("SELECT player_id, rating FROM ratings WHERE player_id IN (?, ?)",
+                                                  (winner_id, loser_id)))
+                winner_rating, loser_rating = rate(current.get(winner_id, default), current.get(loser_id, default))
+                rows = [(winner_id, winner_rating), (loser_id, loser_rating)]
+            connection.executemany("INSERT OR REPLACE INTO ratings VALUES (?, ?)", rows)
+            changes.extend(rows)
+        connection.executemany("INSERT INTO changes (player_id, rating, writer) VALUES (?, ?, ?)",
+                               [(player_id, rating, self.writer_id) for player_id, rating in changes])
+        connection.execute("COMMIT")
+        return len(changes)
+
+    def _write_batch(self, records):
+        if records:
+            start = time.perf_counter()
+            try:
+                self._written += self._commit(self._connection, records)
+            except sqlite3.Error as e:
+                self._connection.rollback()
+                print(f"could not save {len(records)} rating change(s): {e}")
+            metrics.observe("ratings_save_seconds", time.perf_counter() - start)
+
+        if self._written >= self.keep_changes:
+            # every poller is at most a few seconds behind, so old changes are never read again
+            try:
+                with self._connection:
+                    self._connection.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?",
+                                             (self.keep_changes,))
+                self._written = 0
+            except sqlite3.Error as e:
+                print(f"could not trim the rating change log: {e}")
+
+    def close(self):
+        super().close()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
@@ -0,0 +1,150 @@
+"""
+Rebuild the ratings from the match history.
+
+Replays matches.bin with the Elo formula from elo.py, optionally with other
+K-factors or with rating decay, and writes a ratings snapshot the bot can load.
+Matches are grouped into layers in which no player appears twice, keeping each
+player's matches in order, so every layer is rated as one NumPy batch. There are
+at least as many layers as the busiest player has matches; layers too small for a
+batch to pay off, as with one player in a large share of the history, are rated
+one match at a time instead.
+
+Stop the bot before replacing its ratings.json with the output, and remove
+ratings.json.journal, or the journal will be replayed on top of it.
+
+Usage: python recompute_ratings.py [--history matches.bin] [--output ratings.recomputed.json]
+                                   [--k-factors 32 24 16] [--thresholds 0 100]
+                                   [--decay R] [--skip-forfeits]
+"""
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+import elo
+from match_history import record, DRAW, FORFEIT
+
+record_dtype = np.dtype([("time", "<f8"), ("winner", "<u8"), ("loser", "<u8"), ("flags", "u1")])
+assert record_dtype.itemsize == record.size
+
+seconds_per_day = 86400
+# layers with fewer matches are rated in a plain loop; a NumPy batch costs about as much as 20 matches
+min_batch = 20
+
+
+def read_history(path):
+    size = os.path.getsize(path)
+    # a torn record at the end is dropped
+    return np.fromfile(path, dtype=record_dtype, count=size // record.size)
+
+
+def assign_layers(winners, losers, player_count):
+    """
+    Layer of every match: one past the last layer either player appeared in.
+    """
+    last = [0] * player_count
+    layers = np.empty(len(winners), dtype=np.int64)
+    for i, (winner, loser) in enumerate(zip(winners.tolist(), losers.tolist())):
+        layer = max(last[winner], last[loser]) + 1
+        last[winner] = last[loser] = layer
+        layers[i] = layer
+    return layers
+
+
+def recompute(matches, k_factors=elo.default_k_factors, thresholds=elo.default_thresholds, decay=0.0):
+    """
+    Ratings after replaying `matches` in order, as (player ids, ratings) arrays.
+
+    With `decay`, a player's distance from the initial rating shrinks by that
+    fraction per day without a match, applied when they next play and, for
+    everyone, up to the time of the last match.
+    """
+    player_ids, players = np.unique(np.concatenate([matches["winner"], matches["loser"]]), return_inverse=True)
+    winners, losers = players[:len(matches)], players[len(matches):]
+    times = matches["time"]
+
+    ratings = np.full(len(player_ids), elo.initial_rating, dtype=np.float64)
+    last_played = np.full(len(player_ids), np.nan)
+
+    def decayed(indices, now):
+        rating = ratings[indices]
+        if decay:
+            idle_days = np.nan_to_num((now - last_played[indices]) / seconds_per_day)
+            rating = elo.initial_rating + (rating - elo.initial_rating) * (1 - decay) ** idle_days
+        return rating
+
+    def decayed_one(player, now):
+        rating = ratings[player]
+        if decay and not math.isnan(last_played[player]):
+            idle_days = (now - last_played[player]) / seconds_per_day
+            rating = elo.initial_rating + (rating - elo.initial_rating) * (1 - decay) ** idle_days
+        return rating
+
+    def rate_one_by_one(batch):
+        # the same arithmetic as a batch, on Python floats
+        for winner, loser, now in zip(winners[batch].tolist(), losers[batch].tolist(), times[batch].tolist()):
+            winner_rating = decayed_one(winner, now)
+            loser_rating = decayed_one(loser, now)
+            k = elo.k_factor(loser_rating - winner_rating, k_factors, thresholds)
+            ratings[winner], ratings[loser] = elo.rate(winner_rating, loser_rating, k)
+            last_played[winner] = now
+            last_played[loser] = now
+
+    layers = assign_layers(winners, losers, len(player_ids))
+    order = np.argsort(layers, kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(layers)[1:])])
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        batch = order[start:stop]
+        if stop - start < min_batch:
+            rate_one_by_one(batch)
+            continue
+        winner, loser, now = winners[batch], losers[batch], times[batch]
+        winner_rating = decayed(winner, now)
+        loser_rating = decayed(loser, now)
+        k = np.select([loser_rating - winner_rating <= threshold for threshold in thresholds],
+                      k_factors[:-1], k_factors[-1]) if thresholds else k_factors[0]
+        ratings[winner], ratings[loser] = elo.rate(winner_rating, loser_rating, k)
+        last_played[winner] = now
+        last_played[loser] = now
+
+    if decay and len(times):
+        ratings[:] = decayed(np.arange(len(player_ids)), times.max())
+    return player_ids, ratings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the ratings by replaying the match history.")
+    parser.add_argument("--history", default="matches.bin")
+    parser.add_argument("--output", default="ratings.recomputed.json")
+    parser.add_argument("--k-factors", type=float, nargs="+", default=list(elo.default_k_factors),
+                        help="K-factor for each rating-difference threshold, then one for beyond the last")
+    parser.add_argument("--thresholds", type=float, nargs="*", default=list(elo.default_thresholds),
+                        help="rating differences (loser minus winner) where the K-factor changes")
+    parser.add_argument("--decay", type=float, default=0.0,
+                        help="fraction of the distance from the initial rating lost per idle day")
+    parser.add_argument("--skip-forfeits", action="store_true", help="leave forfeited duels unrated")
+    args = parser.parse_args()
+    if len(args.k_factors) != len(args.thresholds) + 1:
+        parser.error("give one more K-factor than thresholds")
+
+    start = time.perf_counter()
+    matches = read_history(args.history)
+    # draws never change ratings, as in the bot
+    unrated = DRAW | (FORFEIT if args.skip_forfeits else 0)
+    rated = matches[(matches["flags"] & unrated) == 0]
+    player_ids, ratings = recompute(rated, tuple(args.k_factors), tuple(args.thresholds), args.decay)
+    elapsed = time.perf_counter() - start
+
+    tmp_path = f"{args.output}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({str(player_id): rating for player_id, rating in zip(player_ids.tolist(), ratings.tolist())}, f)
+    os.replace(tmp_path, args.output)
+    print(f"replayed {len(rated)} of {len(matches)} matches for {len(player_ids)} players in {elapsed:.2f}s,"
+          f" wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Check or watch recorded duels.
+
+verify re-runs replays through engine.py as fast as it can and reports any
+duel the current rules would play differently. play shows a replay at a chosen
+pace, in the terminal or, with --channel, in a Discord channel through the bot.
+
+Usage: python replay.py verify [replays.jsonl ...]
+       python replay.py play REPLAY_ID [--file replays.jsonl] [--pace 1.0] [--channel CHANNEL_ID]
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import replays
+
+
+def verify(paths):
+    checked = failed = actions = 0
+    start = time.perf_counter()
+    for path in paths:
+        for header, records in replays.load(path):
+            _, problems = replays.verify(header, records)
+            checked += 1
+            actions += sum(1 for record in records if record[0] == "action")
+            if problems:
+                failed += 1
+                print(f"{header['id']}:")
+                for problem in problems:
+                    print(f"  {problem}")
+    elapsed = time.perf_counter() - start
+    print(f"verified {checked} replays ({actions} actions) in {elapsed:.2f}s, {failed} failed")
+    return failed == 0
+
+
+def describe(header, line):
+    players = header["players"]
+    kind = line[0]
+    if kind == "summon":
+        return f"<@{players[line[1]]}> summons {line[2][1]} ({line[2][2]} attack, {line[2][3]} health)"
+    if kind == "event":
+        event_kind, seat, card, value = line[1:]
+        if event_kind == "attack":
+            return f"<@{players[seat]}> attacks with {card}!"
+        if event_kind == "defend":
+            return f"<@{players[seat]}> defends with {card}!"
+        if event_kind == "damage":
+            return f"{card} took {value} damage!"
+        if event_kind == "defeated":
+            return f"{card} was defeated!"
+        if event_kind == "result":
+            return "It's a draw!" if seat == -1 else f"<@{players[seat]}> has won the match."
+        return None
+    if kind == "end" and line[1] != "over":
+        return f"The duel ended: {line[1]}."
+    return None
+
+
+def find(path, replay_id):
+    for header, records in replays.load(path):
+        if header["id"] == replay_id:
+            return header, records
+    return None
+
+
+async def play(header, records, pace, channel_id=None):
+    text = [f"Replay {header['id']}: <@{header['players'][0]}> against <@{header['players'][1]}>"]
+    text += [line for line in (describe(header, record) for record in records) if line]
+
+    if channel_id is None:
+        for line in text:
+            print(line)
+            await asyncio.sleep(pace)
+        return
+
+    import discord
+    from BotToken import BotToken
+    from outbox import ChannelOutbox
+
+    client = discord.Client(intents=discord.Intents.default())
+
+    @client.event
+    async def on_ready():
+        try:
+            channel = client.get_channel(channel_id) or await client.fetch_channel(channel_id)
+            outbox = ChannelOutbox(channel)
+            for line in text:
+                outbox.log(line)
+                await outbox.flush()
+                await asyncio.sleep(pace)
+        finally:
+            await client.close()
+
+    await client.start(BotToken)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify or play back recorded duels.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    verify_parser = subparsers.add_parser("verify", help="re-run replays through the rules")
+    verify_parser.add_argument("paths", nargs="*", default=["replays.jsonl"], help="replay files")
+    play_parser = subparsers.add_parser("play", help="show a replay at a chosen pace")
+    play_parser.add_argument("replay_id")
+    play_parser.add_argument("--file", default="replays.jsonl")
+    play_parser.add_argument("--pace", type=float, default=1.0, help="seconds between lines")
+    play_parser.add_argument("--channel", type=int, help="post to this Discord channel instead of the terminal")
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        sys.exit(0 if verify(args.paths) else 1)
+    replay = find(args.file, args.replay_id)
+    if replay is None:
+        parser.error(f"no replay {args.replay_id} in {args.file}")
+    asyncio.run(play(*replay, args.pace, args.channel))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Duel replays, appended to replays.jsonl as one line per finished duel.
+
+Each line is a JSON list. Its first item is a header object (version, replay id,
+ids, start time and, for a duel resumed after a restart, the checkpoint it
+resumed from); every other item is a record:
+
+    ["summon", seat, [identifier, name, attack, health]]
+    ["action", kind, seat, card identifier]
+    ["event", kind, seat, card name, value]     the engine events of the action before it
+    ["end", reason, winner]
+
+The actions are enough to re-run the duel through engine.apply_action; the
+events are kept to check that the rules still produce the same duel.
+"""
+import json
+import time
+
+from card_catalog import CardInstance
+from checkpoints import restore_game, restore_summon
+import engine
+from writer import BatchWriter
+
+replay_version = 1
+
+
+class ReplayRecorder:
+    __slots__ = ("replay_id", "lines")
+
+    def __init__(self, session, resumed_from=None):
+        started = time.time()
+        self.replay_id = f"{session.channel_id}-{int(started * 1000)}"
+        header = {"v": replay_version, "id": self.replay_id, "time": started, "guild": session.guild_id,
+                  "channel": session.channel_id, "players": [session.player1.id, session.player2.id]}
+        if resumed_from is not None:
+            header["resumed_from"] = resumed_from
+        self.lines = [header]
+
+    # records are tuples, which the GC stops tracking, until they are written as JSON lists
+    def summon(self, seat, card):
+        self.lines.append(("summon", seat, tuple(card)))
+
+    def action(self, action, events):
+        self.lines.append(("action",) + action)
+        self.lines.extend(("event",) + event for event in events)
+
+    def end(self, reason, winner):
+        self.lines.append(("end", reason, winner))
+
+    def dumps(self):
+        return json.dumps(self.lines, separators=(",", ":")) + "\n"
+
+
+class ReplayStore:
+    """
+    Appends finished duels' replays to one file from a background thread, in batches.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._writer = BatchWriter("replays", self._append)
+
+    def save(self, recorder):
+        self._writer.put(recorder)
+
+    def _append(self, recorders):
+        if not recorders:
+            return
+        try:
+            with open(self.path, "a") as f:
+                f.writelines(recorder.dumps() for recorder in recorders)
+        except OSError as e:
+            print(f"could not save {len(recorders)} replay(s): {e}")
+
+    def flush(self, timeout=None):
+        """
+        Block until every queued replay is written.
+        """
+        self._writer.flush(timeout)
+
+    def close(self):
+        self._writer.close()
+
+
+def load(path):
+    """
+    Yields (header, records) for every replay in the file, skipping other versions.
+    """
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                header, *records = json.loads(line)
+            except ValueError:
+                # torn write from a crash
+                break
+            if isinstance(header, dict) and header.get("v") == replay_version:
+                yield header, records
+
+
+def verify(header, records):
+    """
+    Re-run a replay through the rules. Returns the final GameState (or None if the duel
+    ended before the battle) and a list of differences from the recorded duel.
+    """
+    problems = []
+    decks = [[], []]
+    state = None
+    resumed = header.get("resumed_from")
+    if resumed is not None:
+        decks = [limbo for _, limbo in restore_summon(resumed["summon"])]
+        state = restore_game(resumed["game"])
+
+    expected = None
+    produced = None
+    for number, line in enumerate(records, 1):
+        kind = line[0]
+        if kind != "event" and expected is not None:
+            if expected != produced:
+                problems.append(f"record {number}: recorded events {expected} but the rules give {produced}")
+            expected = produced = None
+
+        if kind == "summon":
+            decks[line[1]].append(CardInstance(*line[2]))
+        elif kind == "action":
+            if state is None:
+                state = engine.new_game(decks[0], decks[1])
+            try:
+                state, events = engine.apply_action(state, engine.Action(line[1], line[2], line[3]))
+            except engine.IllegalAction as e:
+                problems.append(f"record {number}: illegal action {line[1:]}: {e}")
+                continue
+            expected, produced = [], [list(event) for event in events]
+        elif kind == "event":
+            if expected is None:
+                problems.append(f"record {number}: event without an action")
+            else:
+                expected.append(line[1:])
+        elif kind == "end":
+            winner = line[2]
+            if state is not None and state.phase == engine.OVER and state.winner != winner:
+                problems.append(f"record {number}: recorded winner {winner} but the rules give {state.winner}")
+        else:
+            problems.append(f"record {number}: unknown record {kind!r}")
+
+    if expected is not None and expected != produced:
+        problems.append(f"end: recorded events {expected} but the rules give {produced}")
+    return state, problems
@@ -0,0 +1,148 @@
+import discord
+
+
+class RoomLease:
+    __slots__ = ("guild_id", "channel", "player_ids")
+
+    def __init__(self, guild_id, channel, player_ids):
+        self.guild_id = guild_id
+        self.channel = channel
+        self.player_ids = player_ids
+
+
+class RoomPool:
+    """
+    Duel rooms that are leased to a duel and given back afterwards.
+
+    In "channel" mode each guild keeps up to `max_idle` hidden duel-room channels;
+    leasing one only swaps its permission overwrites (one API call) instead of
+    creating a channel, and releasing hides it again and purges its messages, so
+    the next players cannot read the previous duel. `recover` takes the hidden
+    rooms left by an earlier process back into the pool. In "thread" mode every duel
+    gets a private thread under the channel the duel was started in, which is
+    archived and locked when the duel ends.
+    """
+
+    def __init__(self, mode="channel", max_idle=5, name="duel-room"):
+        if mode not in ("channel", "thread"):
+            raise ValueError(f"unknown room mode {mode!r}")
+        self.mode = mode
+        self.max_idle = max_idle
+        self.name = name
+        self._idle = {}
+        self._leases = {}
+        self._guild_leases = {}
+
+    async def lease(self, guild, parent, player1, player2):
+        if self.mode == "thread":
+            channel = await self._lease_thread(parent, player1, player2)
+        else:
+            channel = await self._lease_channel(guild, player1, player2)
+
+        self.adopt(guild.id, channel, player1, player2)
+        return channel
+
+    def adopt(self, guild_id, channel, player1, player2):
+        """
+        Register a room that is already set up for a duel, e.g. one resumed after a restart.
+        """
+        self._leases[channel.id] = RoomLease(guild_id, channel, (player1.id, player2.id))
+        self._guild_leases.setdefault(guild_id, set()).add(channel.id)
+
+    async def _lease_channel(self, guild, player1, player2):
+        overwrites = {
+            guild.default_role: discord.PermissionOverwrite(read_messages=False),
+            player1: discord.PermissionOverwrite(read_messages=True),
+            player2: discord.PermissionOverwrite(read_messages=True)
+        }
+
+        idle = self._idle.get(guild.id)
+        while idle:
+            channel = idle.pop()
+            try:
+                await channel.edit(overwrites=overwrites)
+                return channel
+            except discord.NotFound:
+                # deleted by someone while it was idle
+                continue
+        return await guild.create_text_channel(self.name, overwrites=overwrites)
+
+    async def _lease_thread(self, parent, player1, player2):
+        if isinstance(parent, discord.Thread):
+            parent = parent.parent
+        thread = await parent.create_thread(name=self.name, type=discord.ChannelType.private_thread,
+                                            invitable=False)
+        await thread.add_user(player1)
+        await thread.add_user(player2)
+        return thread
+
+    async def release(self, channel):
+        lease = self._leases.pop(channel.id, None)
+        if lease is None:
+            return
+        guild_leases = self._guild_leases[lease.guild_id]
+        guild_leases.discard(channel.id)
+        if not guild_leases:
+            del self._guild_leases[lease.guild_id]
+
+        try:
+            if self.mode == "thread":
+                await channel.edit(archived=True, locked=True)
+                return
+
+            idle = self._idle.setdefault(lease.guild_id, [])
+            if len(idle) >= self.max_idle:
+                await channel.delete()
+                return
+            if await self._scrub(channel):
+                idle.append(channel)
+        except discord.NotFound:
+            pass
+
+    async def _scrub(self, channel):
+        """
+        Hide a room and delete its messages. A room that cannot be emptied is deleted
+        instead of being pooled; returns whether it can be leased again.
+        """
+        await channel.edit(overwrites={channel.guild.default_role: discord.PermissionOverwrite(read_messages=False)})
+        try:
+            await channel.purge(limit=None)
+            return True
+        except discord.NotFound:
+            raise
+        except discord.HTTPException as e:
+            print(f"could not purge duel room {channel.id}, deleting it: {e}")
+            await channel.delete()
+            return False
+
+    async def recover(self, guild):
+        """
+        Pool the duel rooms an earlier process left behind in `guild`, and delete those
+        past `max_idle`. Call once the duels being resumed have adopted their rooms.
+        """
+        if self.mode != "channel":
+            return
+        idle = self._idle.setdefault(guild.id, [])
+        for channel in guild.text_channels:
+            if channel.name != self.name or channel.id in self._leases or channel in idle:
+                continue
+            try:
+                if len(idle) >= self.max_idle:
+                    await channel.delete()
+                elif await self._scrub(channel):
+                    idle.append(channel)
+            except discord.NotFound:
+                pass
+            except discord.HTTPException as e:
+                print(f"could not recover duel room {channel.id}: {e}")
+
+    def get(self, channel_id):
+        return self._leases.get(channel_id)
+
+    def guild_rooms(self, guild_id):
+        return [self._leases[channel_id].channel for channel_id in self._guild_leases.get(guild_id, ())]
+
+    def idle_count(self, guild_id=None):
+        if guild_id is not None:
+            return len(self._idle.get(guild_id, ()))
+        return sum(map(len, self._idle.values()))
@@ -0,0 +1,125 @@
+import asyncio
+import time
+
+from metrics import metrics
+from scheduler import scheduler as default_scheduler
+
+wait_histogram = metrics.histogram("player_wait_seconds")
+
+
+class MessageRouter:
+    """
+    Hands incoming messages straight to the coroutine waiting for them.
+
+    Waiters are registered under (channel id, author id), so a message is checked
+    against at most the few predicates of the duel it belongs to; messages from
+    channels nobody is waiting in are dropped with a single dict lookup. Timeouts are
+    deadlines on the shared scheduler, so a channel's clock can be paused or extended.
+    """
+
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler or default_scheduler
+        self._waiters = {}
+        self._channels = {}
+        self._deadlines = {}
+        # optional on_wait(channel_id, author_ids) hook, called when a wait starts
+        self.on_wait = None
+
+    @property
+    def pending(self):
+        return sum(self._channels.values())
+
+    def is_waiting(self, channel_id, author_id):
+        return bool(self._waiters.get((channel_id, author_id)))
+
+    async def wait(self, channel_id, author_ids, accept=None, timeout=None):
+        """
+        Wait for a message from one of `author_ids` in the channel for which `accept(message)`
+        is true. Raises asyncio.TimeoutError after `timeout` seconds, and returns None if
+        the channel's waits are cancelled.
+        """
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, accept)
+        keys = [(channel_id, author_id) for author_id in author_ids]
+        for key in keys:
+            self._waiters.setdefault(key, []).append(waiter)
+        self._channels[channel_id] = self._channels.get(channel_id, 0) + 1
+        if self.on_wait is not None:
+            self.on_wait(channel_id, author_ids)
+
+        deadline = None
+        if timeout is not None:
+            deadline = self.scheduler.call_later(timeout, _time_out, future)
+            self._deadlines.setdefault(channel_id, set()).add(deadline)
+
+        start = time.perf_counter()
+        try:
+            return await future
+        finally:
+            wait_histogram.observe(time.perf_counter() - start)
+            if deadline is not None:
+                deadline.cancel()
+                deadlines = self._deadlines[channel_id]
+                deadlines.discard(deadline)
+                if not deadlines:
+                    del self._deadlines[channel_id]
+            for key in keys:
+                waiters = self._waiters[key]
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._waiters[key]
+            self._channels[channel_id] -= 1
+            if not self._channels[channel_id]:
+                del self._channels[channel_id]
+
+    def dispatch(self, message):
+        if message.channel.id not in self._channels:
+            return False
+        waiters = self._waiters.get((message.channel.id, message.author.id))
+        if not waiters:
+            return False
+
+        # the most recent question gets the answer, e.g. a forfeit prompt during a turn
+        for future, accept in reversed(waiters):
+            if not future.done() and (accept is None or accept(message)):
+                future.set_result(message)
+                return True
+        return False
+
+    def extend(self, channel_id, seconds):
+        """
+        Give every wait in the channel `seconds` of extra time.
+        """
+        for deadline in self._deadlines.get(channel_id, ()):
+            deadline.extend(seconds)
+
+    def pause(self, channel_id):
+        for deadline in self._deadlines.get(channel_id, ()):
+            deadline.pause()
+
+    def resume(self, channel_id):
+        for deadline in self._deadlines.get(channel_id, ()):
+            deadline.resume()
+
+    def time_left(self, channel_id):
+        """
+        Seconds until the channel's earliest wait times out, or None if nothing in it has a timeout.
+        """
+        return min((deadline.time_left() for deadline in self._deadlines.get(channel_id, ())), default=None)
+
+    def cancel_channel(self, channel_id):
+        """
+        Wake every wait in the channel with None, e.g. when its duel is stopped.
+        """
+        if channel_id not in self._channels:
+            return
+        for (waiter_channel_id, _), waiters in list(self._waiters.items()):
+            if waiter_channel_id == channel_id:
+                for future, _ in waiters:
+                    if not future.done():
+                        future.set_result(None)
+
+
+def _time_out(future):
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError())
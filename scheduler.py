@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+
+
+class Deadline:
+    __slots__ = ("scheduler", "key", "when", "remaining", "callback", "args")
+
+    def __init__(self, scheduler, key, when, callback, args):
+        self.scheduler = scheduler
+        self.key = key
+        self.when = when
+        # seconds left while paused, None while running
+        self.remaining = None
+        self.callback = callback
+        self.args = args
+
+    @property
+    def active(self):
+        return self.scheduler._deadlines.get(self.key) is self
+
+    @property
+    def paused(self):
+        return self.remaining is not None
+
+    def time_left(self):
+        if self.remaining is not None:
+            return self.remaining
+        return max(0.0, self.when - self.scheduler._loop().time())
+
+    def cancel(self):
+        self.scheduler._remove(self)
+
+    def extend(self, seconds):
+        """
+        Give `seconds` more (or fewer, if negative) before the deadline fires.
+        """
+        if not self.active:
+            return
+        if self.remaining is not None:
+            self.remaining = max(0.0, self.remaining + seconds)
+        else:
+            self.scheduler._push(self, self.when + seconds)
+
+    def pause(self):
+        if not self.active or self.remaining is not None:
+            return
+        self.remaining = self.time_left()
+        self.when = None
+
+    def resume(self):
+        if not self.active or self.remaining is None:
+            return
+        remaining, self.remaining = self.remaining, None
+        self.scheduler._push(self, self.scheduler._loop().time() + remaining)
+
+
+class DeadlineScheduler:
+    """
+    Every turn timeout and delayed room cleanup, in one heap behind one event-loop timer.
+
+    Deadlines are cancelled, moved or paused by updating the Deadline; the heap keeps
+    the stale entries and skips them when they come up, so none of those operations
+    has to search it. Only the earliest deadline has a timer scheduled on the loop.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._deadlines = {}
+        self._order = itertools.count()
+        self._handle = None
+        self._armed_at = None
+        self._tasks = set()
+
+    @property
+    def pending(self):
+        return len(self._deadlines)
+
+    def _loop(self):
+        return asyncio.get_running_loop()
+
+    def call_later(self, delay, callback, *args, key=None):
+        """
+        Call `callback(*args)` after `delay` seconds; a coroutine it returns is run as a task.
+        Scheduling under a key that already has a deadline replaces that deadline.
+        """
+        if key is None:
+            key = object()
+        previous = self._deadlines.get(key)
+        if previous is not None:
+            self._remove(previous)
+        deadline = Deadline(self, key, None, callback, args)
+        self._deadlines[key] = deadline
+        self._push(deadline, self._loop().time() + delay)
+        return deadline
+
+    def get(self, key):
+        return self._deadlines.get(key)
+
+    def cancel(self, key):
+        deadline = self._deadlines.get(key)
+        if deadline is not None:
+            self._remove(deadline)
+        return deadline
+
+    def _push(self, deadline, when):
+        deadline.when = when
+        heapq.heappush(self._heap, (when, next(self._order), deadline))
+        if self._armed_at is None or when < self._armed_at:
+            self._arm(when)
+
+    def _remove(self, deadline):
+        if self._deadlines.get(deadline.key) is deadline:
+            del self._deadlines[deadline.key]
+        deadline.when = None
+        deadline.remaining = None
+
+    def _arm(self, when):
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = self._loop().call_at(when, self._fire)
+        self._armed_at = when
+
+    def _fire(self):
+        self._handle = None
+        self._armed_at = None
+        now = self._loop().time()
+        heap = self._heap
+        while heap:
+            when, _, deadline = heap[0]
+            if deadline.when != when or not deadline.active:
+                # cancelled, paused or moved since this entry was pushed
+                heapq.heappop(heap)
+                continue
+            if when > now:
+                self._arm(when)
+                return
+            heapq.heappop(heap)
+            self._remove(deadline)
+            self._run(deadline)
+
+    def _run(self, deadline):
+        try:
+            result = deadline.callback(*deadline.args)
+        except Exception as e:
+            print(f"deadline callback {deadline.callback!r} failed: {e!r}")
+            return
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+scheduler = DeadlineScheduler()
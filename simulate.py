@@ -0,0 +1,224 @@
+"""
+Monte Carlo duels for balancing cards.json.
+
+Plays large batches of 3-card duels at once with NumPy, following the same rules as
+engine.apply_action: the attacker and defender each pick a card, both cards take the
+other's attack as damage, defeated cards leave the limbo, and the defender attacks
+next. State is kept as (games, seat, card slot) arrays instead of per-game objects.
+
+Usage: python simulate.py [--games N] [--strategy random|strongest|toughest] [--workers K] [--seed S]
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from card_catalog import CardCatalog
+
+deck_size = 3
+max_exchanges = 200
+
+
+def _choose_random(alive, attack, health, rng):
+    scores = rng.random(alive.shape)
+    scores[~alive] = -1
+    return scores.argmax(axis=1)
+
+
+def _choose_strongest(alive, attack, health, rng):
+    # highest attack first, random among equals
+    scores = attack + rng.random(alive.shape)
+    scores[~alive] = -1
+    return scores.argmax(axis=1)
+
+
+def _choose_toughest(alive, attack, health, rng):
+    scores = health + rng.random(alive.shape)
+    scores[~alive] = -np.inf
+    return scores.argmax(axis=1)
+
+
+strategies = {
+    "random": _choose_random,
+    "strongest": _choose_strongest,
+    "toughest": _choose_toughest,
+}
+
+
+def simulate_batch(attack, health, games, strategy="random", seed=None):
+    """
+    Play `games` duels between random decks and return summed statistics.
+    """
+    rng = np.random.default_rng(seed)
+    choose = strategies[strategy]
+    card_count = len(attack)
+
+    # each seat draws 3 different cards; both seats may hold the same card, as in a real duel
+    decks = np.argsort(rng.random((games, 2, card_count)), axis=2)[:, :, :deck_size]
+    card_attack = attack[decks]
+    card_health = health[decks].astype(np.int32)
+    alive = np.ones((games, 2, deck_size), dtype=bool)
+    attacker = np.zeros(games, dtype=np.intp)
+    exchanges = np.zeros(games, dtype=np.int32)
+    running = np.arange(games)
+
+    for _ in range(max_exchanges):
+        if running.size == 0:
+            break
+        g = running
+        a = attacker[g]
+        d = 1 - a
+
+        attack_slot = choose(alive[g, a], card_attack[g, a], card_health[g, a], rng)
+        defend_slot = choose(alive[g, d], card_attack[g, d], card_health[g, d], rng)
+        attack_damage = card_attack[g, a, attack_slot]
+        defend_damage = card_attack[g, d, defend_slot]
+
+        card_health[g, a, attack_slot] -= defend_damage
+        card_health[g, d, defend_slot] -= attack_damage
+        alive[g, a, attack_slot] = card_health[g, a, attack_slot] > 0
+        alive[g, d, defend_slot] = card_health[g, d, defend_slot] > 0
+
+        exchanges[g] += 1
+        attacker[g] = d
+        cards_left = alive[g].any(axis=2)
+        running = g[cards_left[:, 0] & cards_left[:, 1]]
+
+    cards_left = alive.any(axis=2)
+    winner = np.full(games, -1, dtype=np.int8)
+    winner[cards_left[:, 0] & ~cards_left[:, 1]] = 0
+    winner[cards_left[:, 1] & ~cards_left[:, 0]] = 1
+    unfinished = cards_left[:, 0] & cards_left[:, 1]
+
+    appearances = np.zeros(card_count, dtype=np.int64)
+    wins = np.zeros(card_count, dtype=np.int64)
+    pair_games = np.zeros(card_count * card_count, dtype=np.int64)
+    pair_wins = np.zeros(card_count * card_count, dtype=np.int64)
+    for seat in (0, 1):
+        own = decks[:, seat]
+        won = winner == seat
+        appearances += np.bincount(own.ravel(), minlength=card_count)
+        wins += np.bincount(own[won].ravel(), minlength=card_count)
+
+        # every (own card, opposing card) combination in the game
+        pairs = (own[:, :, None] * card_count + decks[:, 1 - seat][:, None, :]).reshape(games, -1)
+        pair_games += np.bincount(pairs.ravel(), minlength=card_count * card_count)
+        pair_wins += np.bincount(pairs[won].ravel(), minlength=card_count * card_count)
+
+    return {
+        "games": games,
+        "seat_wins": np.bincount(winner[winner >= 0], minlength=2).astype(np.int64),
+        "draws": int(np.count_nonzero(winner == -1) - np.count_nonzero(unfinished)),
+        "unfinished": int(np.count_nonzero(unfinished)),
+        "appearances": appearances,
+        "wins": wins,
+        "pair_games": pair_games.reshape(card_count, card_count),
+        "pair_wins": pair_wins.reshape(card_count, card_count),
+        "lengths": np.bincount(exchanges, minlength=max_exchanges + 1).astype(np.int64),
+    }
+
+
+def _merge(total, part):
+    if total is None:
+        return part
+    return {key: total[key] + part[key] for key in total}
+
+
+def simulate(attack, health, games, strategy="random", seed=None, workers=1, chunk_size=250_000):
+    chunks = [chunk_size] * (games // chunk_size)
+    if games % chunk_size:
+        chunks.append(games % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+
+    total = None
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(simulate_batch, attack, health, size, strategy, chunk_seed)
+                       for size, chunk_seed in zip(chunks, seeds)]
+            for future in futures:
+                total = _merge(total, future.result())
+    else:
+        for size, chunk_seed in zip(chunks, seeds):
+            total = _merge(total, simulate_batch(attack, health, size, strategy, chunk_seed))
+    return total
+
+
+def report(names, stats):
+    games = stats["games"]
+    print(f"{games} games: seat 1 won {stats['seat_wins'][0] / games:.1%}, seat 2 won {stats['seat_wins'][1] / games:.1%},"
+          f" {stats['draws'] / games:.1%} draws, {stats['unfinished']} unfinished")
+
+    lengths = stats["lengths"]
+    exchanges = np.arange(len(lengths))
+    mean = (lengths * exchanges).sum() / games
+    percentiles = np.searchsorted(np.cumsum(lengths), [games * 0.5, games * 0.9, games * 0.99])
+    print(f"exchanges per game: mean {mean:.2f}, p50 {percentiles[0]}, p90 {percentiles[1]}, p99 {percentiles[2]}")
+
+    print()
+    print(f"{'card':<20}{'played':>12}{'win rate':>10}")
+    win_rates = stats["wins"] / np.maximum(stats["appearances"], 1)
+    for i in np.argsort(-win_rates):
+        print(f"{names[i]:<20}{stats['appearances'][i]:>12}{win_rates[i]:>10.1%}")
+
+    print()
+    print("win rate of the row card's deck against the column card's deck")
+    pair_rates = stats["pair_wins"] / np.maximum(stats["pair_games"], 1)
+    short_names = [name[:8] for name in names]
+    print(" " * 20 + "".join(f"{name:>9}" for name in short_names))
+    for i, name in enumerate(names):
+        print(f"{name:<20}" + "".join(f"{rate:>9.1%}" for rate in pair_rates[i]))
+
+
+def to_json(names, stats):
+    games = stats["games"]
+    return {
+        "games": games,
+        "seat_win_rates": (stats["seat_wins"] / games).tolist(),
+        "draw_rate": stats["draws"] / games,
+        "unfinished": stats["unfinished"],
+        "cards": {name: {"played": int(stats["appearances"][i]),
+                         "win_rate": float(stats["wins"][i] / max(stats["appearances"][i], 1))}
+                  for i, name in enumerate(names)},
+        "pairings": {name: {other: float(stats["pair_wins"][i, j] / max(stats["pair_games"][i, j], 1))
+                            for j, other in enumerate(names)}
+                     for i, name in enumerate(names)},
+        "game_lengths": np.trim_zeros(stats["lengths"], "b").tolist(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate random duels to balance cards.json.")
+    parser.add_argument("--cards", default="cards.json")
+    parser.add_argument("--games", type=int, default=1_000_000)
+    parser.add_argument("--strategy", choices=sorted(strategies), default="random")
+    parser.add_argument("--workers", type=int, default=1, help="processes to use, 0 for one per core")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", metavar="PATH", help="also write the results to a JSON file")
+    args = parser.parse_args()
+    if args.games < 1:
+        parser.error("--games must be at least 1")
+
+    catalog = CardCatalog(args.cards)
+    names = [card.name for card in catalog]
+    if len(names) < deck_size:
+        parser.error(f"need at least {deck_size} cards")
+    attack = np.array([card.attack for card in catalog], dtype=np.int32)
+    health = np.array([card.health for card in catalog], dtype=np.int32)
+    workers = args.workers or os.cpu_count()
+
+    start = time.perf_counter()
+    stats = simulate(attack, health, args.games, args.strategy, args.seed, workers)
+    elapsed = time.perf_counter() - start
+    print(f"simulated {args.games} games in {elapsed:.2f}s ({args.games / elapsed:,.0f} games/s)")
+    report(names, stats)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(to_json(names, stats), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Brackets for tournaments: who plays whom each round, and who is ahead.
+
+Only the bookkeeping lives here; commands.py runs the duels and reports the
+results back. Entrants are seeded by rating, seed 1 being the highest rated.
+"""
+import math
+
+SINGLE = "single"
+SWISS = "swiss"
+formats = (SINGLE, SWISS)
+
+
+class Entrant:
+    __slots__ = ("player", "seed", "score", "opponents", "had_bye", "eliminated")
+
+    def __init__(self, player, seed):
+        self.player = player
+        self.seed = seed
+        self.score = 0.0
+        self.opponents = []
+        self.had_bye = False
+        self.eliminated = False
+
+
+class Match:
+    """
+    One pairing of a round. `second` is None for a bye.
+    """
+    __slots__ = ("round", "first", "second", "winner", "reason", "task", "session")
+
+    def __init__(self, round_number, first, second):
+        self.round = round_number
+        self.first = first
+        self.second = second
+        # the winning Entrant, or None after a draw or while undecided
+        self.winner = None
+        # None while undecided, then "bye", "played", "draw" or "time"
+        self.reason = None
+        # set by whoever runs the duel
+        self.task = None
+        self.session = None
+
+    @property
+    def decided(self):
+        return self.reason is not None
+
+    @property
+    def loser(self):
+        if self.winner is None:
+            return None
+        return self.second if self.winner is self.first else self.first
+
+
+def bracket_order(size):
+    """
+    Seeds in bracket position order for a power-of-two `size`, so that seeds 1 and 2
+    can only meet in the final: 1, 8, 4, 5, 2, 7, 3, 6 for 8.
+    """
+    order = [1]
+    while len(order) < size:
+        order = [seed for top in order for seed in (top, 2 * len(order) + 1 - top)]
+    return order
+
+
+class Tournament:
+    def __init__(self, guild_id, channel, organizer, format=SINGLE, rounds=None):
+        if format not in formats:
+            raise ValueError(f"unknown tournament format {format!r}")
+        self.guild_id = guild_id
+        self.channel = channel
+        self.organizer = organizer
+        self.format = format
+        # for Swiss; chosen at start from the field size if not given
+        self.rounds = rounds
+        self.round = 0
+        self.matches = []
+        self.started = False
+        self._signups = {}
+        self._entrants = {}
+        # single elimination: entrants still in, in bracket order, None for an empty slot
+        self._slots = []
+        # set by whoever runs the tournament: its task and an Event set once the current round is over
+        self.task = None
+        self.round_done = None
+        self.cancelled = False
+
+    def __len__(self):
+        return len(self._entrants) if self.started else len(self._signups)
+
+    def __contains__(self, player_id):
+        return player_id in (self._entrants if self.started else self._signups)
+
+    def join(self, player, rating):
+        self._signups[player.id] = (player, rating)
+
+    def leave(self, player_id):
+        return self._signups.pop(player_id, None) is not None
+
+    def cancel(self):
+        """
+        Stop the tournament: no further match is started and no result is recorded.
+        """
+        self.cancelled = True
+
+    def start(self):
+        signups = sorted(self._signups.values(), key=lambda signup: -signup[1])
+        self._entrants = {player.id: Entrant(player, seed) for seed, (player, _) in enumerate(signups, 1)}
+        self.started = True
+        if self.format == SINGLE:
+            size = 1 << max(1, (len(signups) - 1).bit_length())
+            by_seed = {entrant.seed: entrant for entrant in self._entrants.values()}
+            self._slots = [by_seed.get(seed) for seed in bracket_order(size)]
+        elif self.rounds is None:
+            self.rounds = max(1, math.ceil(math.log2(len(signups))))
+
+    # rounds
+    @property
+    def finished(self):
+        if self.format == SINGLE:
+            return len(self.matches) == 1 and self.round_over
+        return self.round >= self.rounds and self.round_over
+
+    @property
+    def round_over(self):
+        return all(match.decided for match in self.matches)
+
+    def next_round(self):
+        """
+        Pair the next round. Byes are decided right away.
+        """
+        self.round += 1
+        if self.format == SINGLE:
+            if self.round > 1:
+                self._slots = [match.winner for match in self.matches]
+            # seeds past the field are empty slots, at most one per pairing, giving the top seeds byes
+            pairs = [(first or second, second if first else None)
+                     for first, second in zip(self._slots[::2], self._slots[1::2])]
+        else:
+            pairs = self._swiss_pairs()
+
+        self.matches = []
+        for first, second in pairs:
+            match = Match(self.round, first, second)
+            if second is None:
+                first.had_bye = True
+                self._decide(match, first, "bye")
+            self.matches.append(match)
+        return self.matches
+
+    def _swiss_pairs(self):
+        standing = sorted(self._entrants.values(), key=lambda entrant: (-entrant.score, entrant.seed))
+        pairs = []
+        if len(standing) % 2:
+            # the lowest placed entrant without a bye yet sits this round out
+            bye = next((entrant for entrant in reversed(standing) if not entrant.had_bye), standing[-1])
+            standing.remove(bye)
+            pairs.append((bye, None))
+        unpaired = standing
+        while unpaired:
+            first = unpaired.pop(0)
+            # closest in the standings that they have not played yet, else simply the closest
+            index = next((i for i, other in enumerate(unpaired) if other.player.id not in first.opponents), 0)
+            pairs.append((first, unpaired.pop(index)))
+        return pairs
+
+    # results
+    def find_match(self, player_id, other_id):
+        for match in self.matches:
+            if not match.decided and match.second is not None and \
+                    {match.first.player.id, match.second.player.id} == {player_id, other_id}:
+                return match
+        return None
+
+    def report(self, winner_id, loser_id, draw=False):
+        """
+        Record a finished duel between two entrants. Returns its Match, or None if they
+        had no undecided match this round.
+        """
+        match = self.find_match(winner_id, loser_id)
+        if match is None or self.cancelled:
+            return None
+        if draw:
+            self._decide(match, None, "draw")
+        else:
+            self._decide(match, self._entrants[winner_id], "played")
+        return match
+
+    def time_out(self, match):
+        """
+        Decide a match that ran out of time: a Swiss match as a draw, an elimination
+        match for the higher seed.
+        """
+        self._decide(match, None, "time")
+
+    def _decide(self, match, winner, reason):
+        if winner is None and self.format == SINGLE:
+            # an elimination match needs a winner: the higher seed goes through
+            winner = min(match.first, match.second, key=lambda entrant: entrant.seed)
+        match.winner = winner
+        match.reason = reason
+        if match.second is None:
+            match.first.score += 1
+            return
+        match.first.opponents.append(match.second.player.id)
+        match.second.opponents.append(match.first.player.id)
+        if winner is None:
+            match.first.score += 0.5
+            match.second.score += 0.5
+        else:
+            winner.score += 1
+            if self.format == SINGLE:
+                match.loser.eliminated = True
+
+    def undecided(self):
+        return [match for match in self.matches if not match.decided]
+
+    # standings
+    def standings(self):
+        """
+        Entrants from first place down: by score, then the summed score of their
+        opponents (Buchholz), then seed. In single elimination, by how far they got.
+        """
+        def buchholz(entrant):
+            return sum(self._entrants[opponent].score for opponent in entrant.opponents)
+
+        return sorted(self._entrants.values(), key=lambda entrant: (-entrant.score, -buchholz(entrant), entrant.seed))
+
+    @property
+    def champion(self):
+        if not self.finished:
+            return None
+        if self.format == SINGLE:
+            return self.matches[0].winner
+        return self.standings()[0]
@@ -0,0 +1,123 @@
+"""
+Select menus and buttons for summoning and battle turns.
+
+Components carry custom ids of the form "deckwars:<action>:<channel id>", and the
+bot routes every click through its on_interaction listener by that id rather
+than through View callbacks. Nothing has to be registered again after a restart:
+a click on a panel sent by an earlier process reaches the resumed duel.
+"""
+import discord
+
+custom_id_prefix = "deckwars"
+# battle log lines kept on the turn panel
+panel_log_lines = 8
+
+
+def custom_id(action, channel_id):
+    return f"{custom_id_prefix}:{action}:{channel_id}"
+
+
+def parse_custom_id(value):
+    """
+    (action, channel id) of one of our components, or None.
+    """
+    parts = value.split(":")
+    if len(parts) != 3 or parts[0] != custom_id_prefix or not parts[2].isdigit():
+        return None
+    return parts[1], int(parts[2])
+
+
+def _layout(*items):
+    view = discord.ui.View(timeout=None)
+    for item in items:
+        view.add_item(item)
+    # only a layout: stopped views are not stored by discord.py, the clicks are routed by custom id
+    view.stop()
+    return view
+
+
+def summon_view(channel_id, templates, count):
+    options = [discord.SelectOption(label=template.name, value=template.name,
+                                    description=f"Attack {template.attack}, Health {template.health}")
+               for template in templates[:25]]
+    select = discord.ui.Select(custom_id=custom_id("summon", channel_id), placeholder=f"Summon {count} cards",
+                               min_values=min(count, len(options)), max_values=min(count, len(options)),
+                               options=options)
+    return _layout(select)
+
+
+def turn_view(channel_id, kind, cards, selected=None):
+    """
+    A card select and the attack or defend button for the player to move.
+    """
+    options = [discord.SelectOption(label=card.name, value=str(card.identifier),
+                                    description=f"Attack {card.attack}, Health {card.health}",
+                                    default=card.identifier == selected)
+               for card in cards if card.health > 0]
+    select = discord.ui.Select(custom_id=custom_id("card", channel_id), placeholder="Choose a card",
+                               options=options or [discord.SelectOption(label="No cards", value="-1")],
+                               disabled=not options)
+    button = discord.ui.Button(custom_id=custom_id(kind, channel_id), label=kind.capitalize(),
+                               style=discord.ButtonStyle.danger if kind == "attack" else discord.ButtonStyle.primary)
+    return _layout(select, button)
+
+
+class ComponentInput:
+    """
+    A click, shaped like the message the router would otherwise get for the same choice.
+    """
+    __slots__ = ("channel", "author", "content", "values", "interaction")
+
+    def __init__(self, channel, author, content, interaction, values=()):
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.values = list(values)
+        self.interaction = interaction
+
+
+class TurnPanel:
+    """
+    The one message of a duel that shows whose turn it is, their cards, the recent
+    battle log and the turn components. Every turn edits it in place; right after a
+    click the edit is the click's interaction response, so it costs no extra call.
+    """
+
+    def __init__(self, outbox):
+        self.outbox = outbox
+        self.message = None
+        self.log = []
+        # id of the player the components are shown to
+        self.turn = None
+        # player id -> card identifier picked in the select, until they press the button
+        self.selection = {}
+        # the click that ended the previous turn, still waiting for its response
+        self.interaction = None
+
+    def add_log(self, line):
+        self.log.append(line)
+        del self.log[:-panel_log_lines]
+
+    async def show(self, content=None, embed=None, view=None):
+        interaction, self.interaction = self.interaction, None
+        await self.outbox.flush()
+        if interaction is not None and not interaction.response.is_done():
+            try:
+                await interaction.response.edit_message(content=content, embed=embed, view=view)
+                if self.message is None:
+                    self.message = interaction.message
+                return
+            except discord.HTTPException:
+                pass
+        if self.message is not None:
+            await self.outbox.edit(self.message, content=content, embed=embed, view=view)
+        else:
+            self.message = await self.outbox.post(content=content, embed=embed, view=view)
+
+    async def acknowledge(self, interaction):
+        # clicks need a response within three seconds, even when no panel update follows
+        if not interaction.response.is_done():
+            try:
+                await interaction.response.defer()
+            except discord.HTTPException:
+                pass
@@ -0,0 +1,83 @@
+import atexit
+import queue
+import threading
+import time
+
+
+class BatchWriter:
+    """
+    A background thread that writes queued records in batches, for the stores that
+    must not block the event loop on the disk.
+
+    The thread is started by the first `put`. It runs `start()` once, then takes
+    everything queued (after waiting `delay` seconds for more to arrive, if given)
+    and hands it to `write(records)`, which is called after every batch, even an
+    empty one. `close` runs `finish()` on the thread after the last batch; it is
+    also called at exit, so queued records are not lost.
+    """
+
+    def __init__(self, name, write, start=None, finish=None, delay=0.0):
+        self.name = name
+        self.delay = delay
+        self._write = write
+        self._start = start
+        self._finish = finish
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        atexit.register(self.close)
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def put(self, record):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        self._queue.put(record)
+
+    def _run(self):
+        if self._start is not None:
+            self._start()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                if self.delay:
+                    time.sleep(self.delay)
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+                # None stops the thread, an Event is set once everything before it is written
+                records = [record for record in batch if record is not None and not isinstance(record, threading.Event)]
+                try:
+                    self._write(records)
+                except Exception as e:
+                    print(f"{self.name} could not write {len(records)} record(s): {e!r}")
+
+                for record in batch:
+                    if isinstance(record, threading.Event):
+                        record.set()
+                if None in batch:
+                    return
+        finally:
+            if self._finish is not None:
+                self._finish()
+
+    def flush(self, timeout=None):
+        """
+        Block until every queued record is written.
+        """
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None